@@ -0,0 +1,50 @@
+"""Agent 运行时模块"""
+from agent_runtime.session_guard import SessionGuard
+from agent_runtime.reaper import run_room_reaper
+from agent_runtime.load import (
+    LoadCalculator,
+    LoadReporter,
+    LoadThresholds,
+    TimedMultilingualModel,
+    DEFAULT_LOAD_THRESHOLD,
+)
+from agent_runtime.batched_inference import (
+    InferenceBatcher,
+    BatchedVAD,
+    BatchedMultilingualModel,
+)
+from agent_runtime.recorder import SessionRecorder
+from agent_runtime.filler import FillerPlayer
+from agent_runtime.checkpoint import ChatCheckpointer, load_chat_context
+from agent_runtime.admission import (
+    AdmissionController,
+    SessionProfile,
+    session_profile,
+)
+from agent_runtime.response_cache import CachedLLM, ResponseCache
+from agent_runtime.user_profile import prefetch_profile, apply_profile, update_profile
+
+__all__ = [
+    "SessionGuard",
+    "run_room_reaper",
+    "LoadCalculator",
+    "LoadReporter",
+    "LoadThresholds",
+    "TimedMultilingualModel",
+    "DEFAULT_LOAD_THRESHOLD",
+    "InferenceBatcher",
+    "BatchedVAD",
+    "BatchedMultilingualModel",
+    "SessionRecorder",
+    "FillerPlayer",
+    "ChatCheckpointer",
+    "load_chat_context",
+    "AdmissionController",
+    "SessionProfile",
+    "session_profile",
+    "CachedLLM",
+    "ResponseCache",
+    "prefetch_profile",
+    "apply_profile",
+    "update_profile",
+]
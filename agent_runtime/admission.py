@@ -0,0 +1,172 @@
+"""准入控制 - Worker 级会话上限、有界等待队列与过载降级
+
+LoadCalculator 的负载值是周期性上报给调度器的，流量突增时调度器在下一次上报之前
+会继续把任务派给同一个 Worker，结果所有会话一起变慢（VAD 滞后、轮次检测卡顿、数据库任务堆积）。
+AdmissionController 作为 rtc_session 的 on_request 在 Worker 主进程中逐个判断任务请求：
+
+- 负载低于 ADMISSION_DEGRADE_LOAD：正常接受；
+- 负载达到 ADMISSION_DEGRADE_LOAD：以降级模式接受（更短的 LLM 上下文和回复，关闭填充音、
+  会话录制和关闭时的画像更新，对话检查点合并间隔加长）；
+- 会话数达到 ADMISSION_MAX_SESSIONS 或负载达到 WORKER_LOAD_THRESHOLD：进入等待队列，
+  最多等待 ADMISSION_QUEUE_TIMEOUT_MS，期间腾出空位则以降级模式接受；
+  队列已满（ADMISSION_QUEUE_SIZE）或等待超时则拒绝，由调度器改派给其他 Worker。
+
+会话模式通过 Agent 参与者属性传给 Job 进程（session_profile() 读取）。
+每次决定都记录日志并计入 peppa_admission_decisions_total。
+"""
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from livekit.agents import AgentServer, JobContext, JobRequest
+
+from agent_runtime import metrics
+from agent_runtime.checkpoint import DEFAULT_CHECKPOINT_INTERVAL
+from agent_runtime.load import LoadCalculator, DEFAULT_LOAD_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+
+# Agent 参与者上记录会话模式的属性名
+SESSION_MODE_ATTRIBUTE = "peppa.session_mode"
+
+# 每个 Worker 的会话上限
+ADMISSION_MAX_SESSIONS = int(os.getenv("ADMISSION_MAX_SESSIONS", "40"))
+# 达到该负载后新会话以降级模式接受
+ADMISSION_DEGRADE_LOAD = float(os.getenv("ADMISSION_DEGRADE_LOAD", "0.6"))
+# 等待队列长度
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "4"))
+# 排队最长等待时间（需远小于调度器等待 Worker 应答的时间）
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "2000")) / 1000
+
+# 已接受但尚未出现在 active_jobs 中的任务最多计入多久（秒）
+_PENDING_ACCEPT_SECONDS = 10.0
+_QUEUE_POLL_INTERVAL = 0.1
+
+
+@dataclass(frozen=True)
+class SessionProfile:
+    """按准入模式调整的会话配置"""
+    mode: str
+    # 每次 LLM 请求携带的最多对话条目数（None 为不限制）
+    max_history_items: Optional[int] = None
+    # 单次回复的最多 token 数（None 为不限制）
+    max_completion_tokens: Optional[int] = None
+    # 填充音、会话录制、关闭时的画像更新
+    optional_features: bool = True
+    # 对话检查点合并写入间隔（秒）
+    checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL
+
+
+NORMAL_PROFILE = SessionProfile(mode="normal")
+DEGRADED_PROFILE = SessionProfile(
+    mode="degraded",
+    max_history_items=int(os.getenv("DEGRADED_MAX_HISTORY_ITEMS", "12")),
+    max_completion_tokens=int(os.getenv("DEGRADED_MAX_COMPLETION_TOKENS", "150")),
+    optional_features=False,
+    checkpoint_interval=float(os.getenv("DEGRADED_CHECKPOINT_INTERVAL_SECONDS", "10")),
+)
+_PROFILES = {p.mode: p for p in (NORMAL_PROFILE, DEGRADED_PROFILE)}
+
+
+def session_profile(ctx: JobContext) -> SessionProfile:
+    """读取准入时分配给本 Job 的会话配置（console 等没有该属性时为正常模式）"""
+    try:
+        attributes = ctx.token_claims().attributes or {}
+    except Exception:
+        attributes = {}
+    return _PROFILES.get(attributes.get(SESSION_MODE_ATTRIBUTE, ""), NORMAL_PROFILE)
+
+
+class AdmissionController:
+    """Worker 主进程的任务准入判断（作为 rtc_session 的 on_request）"""
+
+    def __init__(
+        self,
+        server: AgentServer,
+        load_calculator: LoadCalculator,
+        max_sessions: int = ADMISSION_MAX_SESSIONS,
+        degrade_load: float = ADMISSION_DEGRADE_LOAD,
+        load_threshold: float = DEFAULT_LOAD_THRESHOLD,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ) -> None:
+        self._server = server
+        self._load_calculator = load_calculator
+        self._max_sessions = max_sessions
+        self._degrade_load = degrade_load
+        self._load_threshold = load_threshold
+        self._queue_size = queue_size
+        self._queue_timeout = queue_timeout
+        self._pending: dict[str, float] = {}
+        self._waiting = 0
+
+    def _sessions(self) -> int:
+        """活跃任务数 + 已接受但 Job 进程尚未启动的任务数"""
+        now = time.monotonic()
+        active = {info.job.id for info in self._server.active_jobs}
+        self._pending = {
+            job_id: accepted_at
+            for job_id, accepted_at in self._pending.items()
+            if job_id not in active and now - accepted_at < _PENDING_ACCEPT_SECONDS
+        }
+        return len(active) + len(self._pending)
+
+    def _check(self) -> tuple[Optional[SessionProfile], str]:
+        """返回 (会话配置, 原因)，没有空位时会话配置为 None"""
+        sessions = self._sessions()
+        load = self._load_calculator.sample(self._server).load
+        if sessions >= self._max_sessions:
+            return None, f"会话数 {sessions}/{self._max_sessions}"
+        if load >= self._load_threshold:
+            return None, f"负载 {load:.2f} ≥ {self._load_threshold:.2f}"
+        if load >= self._degrade_load:
+            return DEGRADED_PROFILE, f"负载 {load:.2f} ≥ {self._degrade_load:.2f}"
+        return NORMAL_PROFILE, f"会话数 {sessions}, 负载 {load:.2f}"
+
+    async def __call__(self, req: JobRequest) -> None:
+        profile, detail = self._check()
+        queued = profile is None
+
+        if queued:
+            if self._waiting >= self._queue_size:
+                await self._reject(req, "queue_full", detail)
+                return
+
+            started = time.monotonic()
+            self._waiting += 1
+            try:
+                while profile is None and time.monotonic() - started < self._queue_timeout:
+                    await asyncio.sleep(_QUEUE_POLL_INTERVAL)
+                    profile, detail = self._check()
+            finally:
+                self._waiting -= 1
+            waited = time.monotonic() - started
+            metrics.observe_admission_wait(waited)
+
+            if profile is None:
+                await self._reject(req, "queue_timeout", f"{detail}，排队 {waited * 1000:.0f}ms")
+                return
+            # 排队后才接受的会话说明 Worker 已接近满载，一律降级
+            profile = DEGRADED_PROFILE
+            detail = f"排队 {waited * 1000:.0f}ms 后有空位"
+
+        # 检查和登记之间没有 await，并发的请求不会抢到同一个空位
+        self._pending[req.id] = time.monotonic()
+        reason = "queued" if queued else ("ok" if profile is NORMAL_PROFILE else "high_load")
+        metrics.admission_decision(profile.mode, reason)
+        if profile is NORMAL_PROFILE:
+            logger.info(f"✓ 接受任务 {req.id}（房间 {req.room.name}）: {detail}")
+        else:
+            logger.warning(f"⚠️  以降级模式接受任务 {req.id}（房间 {req.room.name}）: {detail}")
+
+        await req.accept(attributes={SESSION_MODE_ATTRIBUTE: profile.mode})
+
+    async def _reject(self, req: JobRequest, reason: str, detail: str) -> None:
+        metrics.admission_decision("rejected", reason)
+        logger.warning(f"⚠️  拒绝任务 {req.id}（房间 {req.room.name}，{reason}）: {detail}")
+        # terminate=False：由调度器改派给其他 Worker
+        await req.reject(terminate=False)
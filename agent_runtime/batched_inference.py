@@ -0,0 +1,430 @@
+"""批量推理 - 跨会话合并 VAD 与轮次检测的 ONNX 调用
+
+每个会话原本各自执行 Silero VAD 和 MultilingualModel 推理，并发会话多时会产生
+大量小而分散的 ONNX 调用。InferenceBatcher 把同时等待推理的输入合并为一次批量调用，
+批次直接在调用线程中执行，结果按行分发回各调用者。
+
+- VAD：批处理器按 ONNX 会话划分，同一个 BatchedVAD 实例的所有 VADStream 共享一个批处理器，
+  BatchedVAD 每个进程只加载一次（见 peppa_agent 的 prewarm）。
+  Silero 模型本身支持 batch 维度，各流的 RNN 状态按行拼接、按行拆回，结果与逐个推理一致。
+  只有线程执行器（多个 Job 共享进程）下才有可合并的流；默认的进程执行器一个 Job 一个进程，
+  prewarm 以 batched=False 加载，逐流直接推理（仍使用共享内存映射的权重）。
+  VAD 每 32ms 推理一次且每次耗时很短，经由 Worker 推理进程做跨进程批处理的 IPC 往返
+  开销高于批处理收益，因此不这样做。
+- 轮次检测：注册到 Worker 推理进程的 BatchedEOURunner，所有 Job 进程的请求都在这里汇合。
+  livekit 的推理进程原本逐个处理请求，这里改为并发分发，批次才能真正形成；不设等待窗口，
+  单个请求立即执行，一批执行期间到达的请求合并为下一批。
+  模型是因果语言模型，右侧补齐不会影响各序列最后一个有效位置的输出。
+"""
+import os
+import json
+import math
+import time
+import asyncio
+import inspect
+import logging
+import threading
+import weakref
+from typing import Any, Callable, ClassVar, Generic, Optional, TypeVar
+
+import numpy as np
+import onnxruntime
+from livekit.agents.inference_runner import _InferenceRunner
+from livekit.agents.ipc import inference_proc_lazy_main, proto
+from livekit.agents.ipc.proc_client import _dump_stack_traces_impl
+from livekit.agents.utils import log_exceptions
+from livekit.agents.utils import hw
+from livekit.plugins import silero
+from livekit.plugins.silero import onnx_model
+from livekit.plugins.silero.vad import VADStream, _VADOptions
+from livekit.plugins.turn_detector.base import MAX_HISTORY_TOKENS
+from livekit.plugins.turn_detector.models import HG_MODEL
+from livekit.plugins.turn_detector.multilingual import (
+    _EUORunnerMultilingual,
+    _remote_inference_url,
+)
+
+from agent_runtime import shared_weights
+from agent_runtime.load import TimedMultilingualModel
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+# VAD 批处理窗口上限（毫秒）：VAD 每 32ms 推理一次，窗口必须远小于该间隔
+VAD_BATCH_WINDOW_MS = float(os.getenv("VAD_BATCH_WINDOW_MS", "4"))
+VAD_MAX_BATCH = int(os.getenv("VAD_MAX_BATCH", "64"))
+# 轮次检测单批最多请求数（不设等待窗口，批次由并发请求自然形成）
+EOU_MAX_BATCH = int(os.getenv("EOU_MAX_BATCH", "16"))
+
+
+class _Request(Generic[T, R]):
+    __slots__ = ("item", "result", "error", "done")
+
+    def __init__(self, item: T) -> None:
+        self.item = item
+        self.result: Optional[R] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+
+
+class InferenceBatcher(Generic[T, R]):
+    """通用批处理器（批次在调用线程中执行，不经过额外的调度线程和线程池）
+
+    没有批次在执行时，调用者立即成为执行者，把队列中已有的请求一起带上推理；
+    批次执行期间到达的请求排队，上一批结束后由其中一个调用者作为下一批执行。
+    因此批次大小随并发自然增长，单个请求不需要等待。
+
+    adaptive=True 时执行者最多再等待 max_wait，直到请求数达到已注册的客户端数
+    （客户端按固定节奏推理的 VAD 流）；max_wait=0 时从不等待。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        batch_fn: Callable[[list[T]], list[R]],
+        max_batch: int,
+        max_wait: float = 0.0,
+        adaptive: bool = True,
+    ) -> None:
+        self._name = name
+        self._batch_fn = batch_fn
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._adaptive = adaptive
+        self._cond = threading.Condition()
+        self._pending: list[_Request[T, R]] = []
+        self._running = False
+        self._clients = 0
+
+    def add_client(self) -> None:
+        with self._cond:
+            self._clients += 1
+
+    def remove_client(self) -> None:
+        with self._cond:
+            self._clients = max(0, self._clients - 1)
+
+    def run(self, item: T) -> R:
+        """提交并阻塞等待结果（在工作线程中调用）"""
+        request: _Request[T, R] = _Request(item)
+        with self._cond:
+            self._pending.append(request)
+            self._cond.notify_all()
+            while self._running and not request.done:
+                self._cond.wait()
+            batch = None
+            if not request.done:
+                self._running = True
+                batch = self._take_batch(request)
+
+        if batch is not None:
+            self._run_batch(batch)
+
+        if request.error is not None:
+            raise request.error
+        return request.result  # type: ignore[return-value]
+
+    def _take_batch(self, leader: _Request[T, R]) -> list[_Request[T, R]]:
+        """取出下一批（持有锁时调用），执行者自己的请求一定在批次中"""
+        if self._adaptive and self._max_wait > 0:
+            target = min(self._max_batch, max(1, self._clients))
+            deadline = time.perf_counter() + self._max_wait
+            while len(self._pending) < target:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+        self._pending.remove(leader)
+        batch = [leader] + self._pending[: self._max_batch - 1]
+        del self._pending[: self._max_batch - 1]
+        return batch
+
+    def _run_batch(self, batch: list[_Request[T, R]]) -> None:
+        try:
+            results = self._batch_fn([request.item for request in batch])
+        except Exception as e:
+            logger.error(f"{self._name} 批量推理失败: batch={len(batch)}, error={e}", exc_info=True)
+            results = None
+            error: Optional[Exception] = e
+        else:
+            error = None
+
+        with self._cond:
+            for i, request in enumerate(batch):
+                if error is not None:
+                    request.error = error
+                else:
+                    request.result = results[i]
+                request.done = True
+            self._running = False
+            self._cond.notify_all()
+
+
+# ========== VAD ==========
+
+_vad_batchers: "weakref.WeakKeyDictionary[Any, InferenceBatcher]" = weakref.WeakKeyDictionary()
+_vad_batchers_lock = threading.Lock()
+
+
+def _get_vad_batcher(onnx_session: Any, sample_rate: int) -> InferenceBatcher:
+    """每个 ONNX 会话对应一个进程级 VAD 批处理器"""
+    with _vad_batchers_lock:
+        batcher = _vad_batchers.get(onnx_session)
+        if batcher is None:
+            sample_rate_nd = np.array(sample_rate, dtype=np.int64)
+
+            def _run_vad_batch(
+                items: list[tuple[np.ndarray, np.ndarray]],
+            ) -> list[tuple[float, np.ndarray]]:
+                inputs = np.concatenate([x for x, _ in items], axis=0)
+                states = np.concatenate([s for _, s in items], axis=1)
+                out, new_states = onnx_session.run(
+                    None, {"input": inputs, "state": states, "sr": sample_rate_nd}
+                )
+                out = out.reshape(len(items), -1)
+                return [
+                    (float(out[i, -1]), new_states[:, i : i + 1, :])
+                    for i in range(len(items))
+                ]
+
+            batcher = InferenceBatcher(
+                "vad",
+                _run_vad_batch,
+                max_batch=VAD_MAX_BATCH,
+                max_wait=VAD_BATCH_WINDOW_MS / 1000,
+            )
+            _vad_batchers[onnx_session] = batcher
+        return batcher
+
+
+class BatchedOnnxModel(onnx_model.OnnxModel):
+    """通过批处理器执行推理的 Silero 模型（每个 VADStream 一个，保存各自的 RNN 状态）"""
+
+    def __init__(self, *, onnx_session: Any, sample_rate: int) -> None:
+        super().__init__(onnx_session=onnx_session, sample_rate=sample_rate)
+        self._batcher = _get_vad_batcher(onnx_session, sample_rate)
+        self._batcher.add_client()
+        weakref.finalize(self, self._batcher.remove_client)
+
+    def __call__(self, x: np.ndarray) -> float:
+        self._input_buffer[:, : self._context_size] = self._context
+        self._input_buffer[:, self._context_size :] = x
+
+        prob, self._rnn_state = self._batcher.run((self._input_buffer, self._rnn_state))
+        self._context = self._input_buffer[:, -self._context_size :]
+        return prob
+
+
+class BatchedVAD(silero.VAD):
+    """批量推理的 Silero VAD，用法与 silero.VAD 相同：BatchedVAD.load()
+
+    每次 load() 都会创建新的 ONNX 会话和批处理器，进程内应只加载一次并让所有会话共用。
+    batched=False 时各流直接使用 silero 原生的 OnnxModel 推理，只保留共享权重。
+    """
+
+    _batched = True
+
+    @classmethod
+    def load(cls, batched: bool = True, **kwargs: Any) -> "BatchedVAD":
+        """优先使用共享内存映射的权重，未准备时回退到 silero.VAD.load()"""
+        vad = cls._load(**kwargs)
+        vad._batched = batched
+        return vad
+
+    @classmethod
+    def _load(cls, **kwargs: Any) -> "BatchedVAD":
+        if kwargs.get("onnx_file_path") or not kwargs.get("force_cpu", True):
+            return super().load(**kwargs)
+
+        # 与 onnx_model.new_inference_session 的配置保持一致
+        sess_options = onnxruntime.SessionOptions()
+        sess_options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        sess_options.add_session_config_entry("session.inter_op.allow_spinning", "0")
+        sess_options.inter_op_num_threads = 1
+        sess_options.intra_op_num_threads = 1
+        sess_options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+
+        session = shared_weights.load_session(shared_weights.SILERO_VAD, sess_options)
+        if session is None:
+            return super().load(**kwargs)
+
+        # 未传入的参数使用 silero.VAD.load() 的默认值
+        params = inspect.signature(silero.VAD.load).parameters
+        opts = {
+            name: kwargs.get(name, params[name].default)
+            for name in (
+                "min_speech_duration",
+                "min_silence_duration",
+                "prefix_padding_duration",
+                "max_buffered_speech",
+                "activation_threshold",
+                "sample_rate",
+            )
+        }
+        deactivation_threshold = kwargs.get("deactivation_threshold")
+        opts["deactivation_threshold"] = deactivation_threshold or max(
+            opts["activation_threshold"] - 0.15, 0.01
+        )
+        return cls(session=session, opts=_VADOptions(**opts))
+
+    def stream(self) -> VADStream:
+        model_cls = BatchedOnnxModel if self._batched else onnx_model.OnnxModel
+        stream = VADStream(
+            self,
+            self._opts,
+            model_cls(onnx_session=self._onnx_session, sample_rate=self._opts.sample_rate),
+        )
+        self._streams.add(stream)
+        return stream
+
+
+# ========== 轮次检测 ==========
+
+class BatchedEOURunner(_EUORunnerMultilingual):
+    """在 Worker 推理进程中批量执行的轮次检测
+
+    推理进程并发分发本 runner 的请求（见 _concurrent_entrypoint），run() 在推理进程的
+    线程池中同时执行，已在等待的请求合并为一批。
+    """
+
+    INFERENCE_METHOD = "peppa_end_of_utterance_multilingual_batched"
+    # 推理进程对本 runner 的请求并发分发
+    CONCURRENT_REQUESTS: ClassVar[bool] = True
+
+    def initialize(self) -> None:
+        session = shared_weights.load_session(
+            shared_weights.TURN_DETECTOR, self._session_options()
+        )
+        if session is None:
+            super().initialize()
+        else:
+            from transformers import AutoTokenizer
+
+            self._session = session
+            self._tokenizer = AutoTokenizer.from_pretrained(
+                HG_MODEL,
+                revision=self.model_revision(),
+                local_files_only=True,
+                truncation_side="left",
+            )
+
+        pad_token_id = self._tokenizer.pad_token_id
+        self._pad_token_id = pad_token_id if pad_token_id is not None else 0
+        # 分词器不是线程安全的（并发调用会报 "Already borrowed"）
+        self._tokenizer_lock = threading.Lock()
+        self._batcher: InferenceBatcher[np.ndarray, float] = InferenceBatcher(
+            "eou",
+            self._run_batch,
+            max_batch=EOU_MAX_BATCH,
+            # 请求来自所有 Job 进程，不等待凑批：上一批执行期间到达的请求组成下一批
+            adaptive=False,
+        )
+
+    @staticmethod
+    def _session_options() -> onnxruntime.SessionOptions:
+        """与 _EUORunnerBase.initialize 的配置保持一致"""
+        sess_options = onnxruntime.SessionOptions()
+        sess_options.intra_op_num_threads = max(
+            1, min(math.ceil(hw.get_cpu_monitor().cpu_count()) // 2, 4)
+        )
+        sess_options.inter_op_num_threads = 1
+        sess_options.add_session_config_entry("session.dynamic_block_base", "4")
+        return sess_options
+
+    def _run_batch(self, items: list[np.ndarray]) -> list[float]:
+        lengths = [len(ids) for ids in items]
+        max_len = max(lengths)
+        input_ids = np.full((len(items), max_len), self._pad_token_id, dtype=np.int64)
+        for i, ids in enumerate(items):
+            input_ids[i, : len(ids)] = ids
+
+        outputs = self._session.run(None, {"input_ids": input_ids})
+        probs = outputs[0].reshape(len(items), -1)
+        if probs.shape[1] != max_len:
+            # 模型只输出最后一个位置时无法安全补齐，逐个执行
+            return [
+                float(self._session.run(None, {"input_ids": ids[None, :]})[0].flatten()[-1])
+                for ids in items
+            ]
+        return [float(probs[i, length - 1]) for i, length in enumerate(lengths)]
+
+    def run(self, data: bytes) -> Optional[bytes]:
+        data_json = json.loads(data)
+        chat_ctx = data_json.get("chat_ctx", None)
+
+        if not chat_ctx:
+            raise ValueError("chat_ctx is required on the inference input data")
+
+        start_time = time.perf_counter()
+        with self._tokenizer_lock:
+            text = self._format_chat_ctx(chat_ctx)
+            inputs = self._tokenizer(
+                text,
+                add_special_tokens=False,
+                return_tensors="np",
+                max_length=MAX_HISTORY_TOKENS,
+                truncation=True,
+            )
+        eou_probability = self._batcher.run(inputs["input_ids"][0].astype("int64"))
+        end_time = time.perf_counter()
+
+        result: dict[str, Any] = {
+            "eou_probability": eou_probability,
+            "duration": round(end_time - start_time, 3),
+            "input": text,
+        }
+        return json.dumps(result).encode()
+
+
+class BatchedMultilingualModel(TimedMultilingualModel):
+    """使用 BatchedEOURunner 的 MultilingualModel（远程推理模式下行为不变）
+
+    本地推理时插件自带的 runner 已被替换，必须使用这个类而不是 MultilingualModel。
+    """
+
+    def _inference_method(self) -> str:
+        return BatchedEOURunner.INFERENCE_METHOD
+
+
+@log_exceptions(logger=logger)
+async def _concurrent_entrypoint(
+    self: inference_proc_lazy_main._InferenceProc, cch: Any
+) -> None:
+    """推理进程的消息循环（替换 _InferenceProc.entrypoint）
+
+    原实现逐个 await 推理请求，一个请求执行完才读取下一个，runner 永远只看到一个输入。
+    这里对声明了 CONCURRENT_REQUESTS 的 runner 每个请求单独起一个任务，交给推理进程的
+    线程池并发执行；其他 runner（不保证线程安全）仍按原来的方式逐个执行。
+    """
+    tasks: set[asyncio.Task] = set()
+    async for msg in cch:
+        if isinstance(msg, proto.InferenceRequest):
+            runner = self._runners.get(msg.method)
+            if getattr(runner, "CONCURRENT_REQUESTS", False):
+                task = asyncio.create_task(self._handle_inference_request(msg))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            else:
+                await self._handle_inference_request(msg)
+
+        if isinstance(msg, proto.ShutdownRequest):
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            await self._client.send(proto.Exiting(reason=msg.reason))
+            break
+
+        if isinstance(msg, proto.DumpStackTraceRequest):
+            _dump_stack_traces_impl()
+
+
+if not _remote_inference_url():
+    # 替换插件导入时注册的 _EUORunnerMultilingual：推理进程会初始化所有已注册的 runner，
+    # 保留它会多加载一份轮次检测模型和分词器（且不走共享权重）
+    _InferenceRunner.registered_runners.pop(_EUORunnerMultilingual.INFERENCE_METHOD, None)
+    _InferenceRunner.register_runner(BatchedEOURunner)
+    # 推理进程反序列化已注册的 runner 时会导入本模块，替换在进程入口执行之前生效
+    inference_proc_lazy_main._InferenceProc.entrypoint = _concurrent_entrypoint
@@ -0,0 +1,114 @@
+"""对话上下文检查点 - 按房间增量保存 chat context，新 Job 从检查点恢复会话
+
+Job 进程崩溃或孩子短暂掉线后，同一房间会重新分配一个新 Job。新 Job 启动时读取
+该房间的检查点恢复对话上下文并跳过开场白，直接接着之前的对话继续。
+
+写入不在热路径上：conversation_item_added 回调只把新条目序列化后放入缓冲，
+每 CHAT_CHECKPOINT_INTERVAL_SECONDS 合并为一行增量检查点在后台写入，Job 关闭时再写一次。
+已关闭房间的检查点由房间回收任务清理。
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from livekit.agents import AgentSession, llm
+
+from database import AsyncSessionLocal, ChatCheckpointRepository
+from agent_runtime import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# 增量检查点的合并写入间隔（秒）
+DEFAULT_CHECKPOINT_INTERVAL = float(os.getenv("CHAT_CHECKPOINT_INTERVAL_SECONDS", "2"))
+
+
+async def load_chat_context(room_name: str) -> tuple[Optional[llm.ChatContext], int]:
+    """读取房间的检查点（一次按索引的查询，走主库）
+
+    Returns:
+        tuple[Optional[ChatContext], int]: (恢复的对话上下文，没有检查点时为 None, 最后的检查点序号)
+    """
+    started = time.perf_counter()
+    try:
+        async with AsyncSessionLocal() as db:
+            items, last_seq = await ChatCheckpointRepository.get_items(db, room_name)
+        if not items:
+            return None, 0
+        chat_ctx = llm.ChatContext.from_dict({"items": items})
+    except Exception as e:
+        logger.error(f"读取对话检查点失败，按新会话启动: room={room_name}, error={e}", exc_info=True)
+        return None, 0
+
+    logger.info(
+        f"✓ 已从检查点恢复房间 {room_name} 的对话: {len(items)} 条, "
+        f"seq={last_seq}, 耗时 {(time.perf_counter() - started) * 1000:.0f}ms"
+    )
+    return chat_ctx, last_seq
+
+
+class ChatCheckpointer:
+    """按房间增量写入对话上下文检查点（每个会话一个实例）"""
+
+    def __init__(
+        self,
+        room_name: str,
+        last_seq: int = 0,
+        interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+    ):
+        self._room_name = room_name
+        self._seq = last_seq
+        self._interval = interval
+        self._pending: list[dict] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def attach(self, session: AgentSession) -> None:
+        session.on("conversation_item_added", self._on_conversation_item_added)
+
+    def _on_conversation_item_added(self, event) -> None:
+        try:
+            self._pending.extend(
+                llm.ChatContext([event.item]).to_dict(exclude_timestamp=False)["items"]
+            )
+        except Exception as e:
+            logger.error(f"序列化对话条目失败（不影响Agent）: {e}", exc_info=True)
+            return
+        if self._flush_task is None:
+            self._flush_task = metrics.background_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self._interval)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """把缓冲的条目写为一个增量检查点，失败时保留到下次重试"""
+        async with self._lock:
+            if not self._pending:
+                return
+            items, self._pending = self._pending, []
+            seq = self._seq + 1
+            try:
+                async with AsyncSessionLocal() as db:
+                    try:
+                        async with metrics.db_write("ChatCheckpointRepository.append"):
+                            await ChatCheckpointRepository.append(db, self._room_name, seq, items)
+                            await db.commit()
+                    except Exception:
+                        await db.rollback()
+                        raise
+                self._seq = seq
+                logger.debug(f"已写入对话检查点: room={self._room_name}, seq={seq}, items={len(items)}")
+            except Exception as e:
+                logger.error(f"写入对话检查点失败（不影响Agent）: room={self._room_name}, error={e}")
+                self._pending[:0] = items
+
+    async def aclose(self) -> None:
+        """Job 关闭时写入剩余条目"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        self._flush_task = None
+        await self.flush()
@@ -0,0 +1,345 @@
+"""填充音 - LLM 思考过久时播放一句预合成的角色短语，掩盖回复前的静音
+
+用户说完后 Agent 进入 thinking 状态，超过 FILLER_DELAY_MS 仍未开始说话时，
+从当前角色的预合成短语（如 "Ooh!"、"Oink, let me think!"）中随机播放一句。
+填充音通过单独的音频轨道播放，真实回复的音频开始播放（Agent 进入 speaking）或用户
+重新开口时，立即清空轨道中已排队的填充音，再从当前播放位置起在 FILLER_FADE_MS 内淡出；
+回复足够快时不会触发。
+
+预合成（每个节点执行一次，和 download-files 一起放在镜像构建阶段）:
+    python -m agent_runtime.filler synthesize --persona peppa
+
+未找到短语音频时填充音自动关闭。
+"""
+import os
+import sys
+import time
+import wave
+import random
+import asyncio
+import logging
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import numpy as np
+from livekit import rtc
+from livekit.agents import AgentSession
+
+from agent_runtime import metrics
+
+logger = logging.getLogger(__name__)
+
+
+FILLER_AUDIO_DIR = os.getenv(
+    "FILLER_AUDIO_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "peppa-agent", "filler"),
+)
+# 用户说完后多久仍未开始回复才播放填充音
+DEFAULT_FILLER_DELAY = float(os.getenv("FILLER_DELAY_MS", "800")) / 1000
+# 回复开始时填充音的淡出时长
+FILLER_FADE = float(os.getenv("FILLER_FADE_MS", "80")) / 1000
+
+FILLER_SAMPLE_RATE = 24000
+_FRAME_MS = 20
+# 填充音轨道的缓冲越小，淡出越及时
+_SOURCE_QUEUE_MS = 100
+
+# 各角色的填充短语（预合成时使用）
+FILLER_PHRASES: dict[str, list[str]] = {
+    "peppa": [
+        "Ooh!",
+        "Oink, let me think!",
+        "Hmm, hmm!",
+        "Ooh, good question!",
+        "Oink oink!",
+    ],
+}
+
+
+@dataclass
+class FillerClip:
+    name: str
+    frames: list[rtc.AudioFrame]
+
+    @property
+    def duration(self) -> float:
+        return sum(f.duration for f in self.frames)
+
+
+_clip_cache: dict[str, list[FillerClip]] = {}
+
+
+def _read_wav(path: Path) -> list[rtc.AudioFrame]:
+    with wave.open(str(path), "rb") as f:
+        sample_rate, num_channels = f.getframerate(), f.getnchannels()
+        data = f.readframes(f.getnframes())
+
+    samples = np.frombuffer(data, dtype=np.int16)
+    if num_channels > 1:
+        samples = samples.reshape(-1, num_channels).mean(axis=1).astype(np.int16)
+    frame = rtc.AudioFrame(
+        data=samples.tobytes(),
+        sample_rate=sample_rate,
+        num_channels=1,
+        samples_per_channel=len(samples),
+    )
+    if sample_rate != FILLER_SAMPLE_RATE:
+        resampler = rtc.AudioResampler(sample_rate, FILLER_SAMPLE_RATE, num_channels=1)
+        frame = rtc.combine_audio_frames(resampler.push(frame) + resampler.flush())
+
+    pcm = np.frombuffer(frame.data, dtype=np.int16)
+    step = FILLER_SAMPLE_RATE * _FRAME_MS // 1000
+    return [
+        rtc.AudioFrame(
+            data=pcm[i:i + step].tobytes(),
+            sample_rate=FILLER_SAMPLE_RATE,
+            num_channels=1,
+            samples_per_channel=len(pcm[i:i + step]),
+        )
+        for i in range(0, len(pcm), step)
+    ]
+
+
+def load_clips(persona: str) -> list[FillerClip]:
+    """加载角色的填充音（每个进程只读取一次）"""
+    if persona not in _clip_cache:
+        clips = []
+        if FILLER_AUDIO_DIR:
+            for path in sorted(Path(FILLER_AUDIO_DIR, persona).glob("*.wav")):
+                try:
+                    clips.append(FillerClip(path.stem, _read_wav(path)))
+                except Exception as e:
+                    logger.warning(f"⚠️  填充音 {path} 读取失败: {e}")
+        _clip_cache[persona] = clips
+    return _clip_cache[persona]
+
+
+class FillerPlayer:
+    """在 LLM 首个回复迟到时播放填充音（每个会话一个实例）"""
+
+    def __init__(
+        self,
+        session: AgentSession,
+        persona: str,
+        delay: float = DEFAULT_FILLER_DELAY,
+    ):
+        self._session = session
+        self._persona = persona
+        self._delay = delay
+        self._clips = load_clips(persona)
+
+        self._source: Optional[rtc.AudioSource] = None
+        self._timer: Optional[asyncio.Task] = None
+        self._play_task: Optional[asyncio.Task] = None
+        self._last_clip: Optional[str] = None
+        self._turn_pending = False
+        self._handoff = asyncio.Event()
+        # 交接时被清空的已排队帧数，淡出从这些帧的位置重新开始
+        self._rewind_frames = 0
+        self._played_at = 0.0
+        self._played_clip: Optional[FillerClip] = None
+        self._closed = False
+
+        # 会话统计
+        self._turns = 0
+        self._fired = 0
+        self._covered = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._clips)
+
+    async def start(self, room: rtc.Room) -> None:
+        """发布填充音轨道并注册会话事件（在 session.start() 之后调用，可放在后台执行）"""
+        if not self.enabled:
+            logger.info(f"未找到角色 {self._persona} 的填充音（{FILLER_AUDIO_DIR}），填充音关闭")
+            return
+
+        source = rtc.AudioSource(FILLER_SAMPLE_RATE, 1, queue_size_ms=_SOURCE_QUEUE_MS)
+        track = rtc.LocalAudioTrack.create_audio_track("filler", source)
+        try:
+            await room.local_participant.publish_track(
+                track, rtc.TrackPublishOptions(source=rtc.TrackSource.SOURCE_MICROPHONE)
+            )
+        except Exception as e:
+            logger.error(f"发布填充音轨道失败（填充音关闭）: {e}", exc_info=True)
+            await source.aclose()
+            return
+        if self._closed:
+            # 轨道发布期间会话已结束
+            await source.aclose()
+            return
+        self._source = source
+
+        self._session.on("user_input_transcribed", self._on_user_input_transcribed)
+        self._session.on("user_state_changed", self._on_user_state_changed)
+        self._session.on("agent_state_changed", self._on_agent_state_changed)
+        logger.info(
+            f"✓ 填充音已启用: persona={self._persona}, clips={len(self._clips)}, "
+            f"delay={self._delay * 1000:.0f}ms"
+        )
+
+    async def aclose(self) -> None:
+        self._closed = True
+        self._cancel_timer()
+        self._stop_playback()
+        if self._play_task:
+            await asyncio.gather(self._play_task, return_exceptions=True)
+        if self._source:
+            await self._source.aclose()
+        if self._turns:
+            logger.info(
+                f"填充音统计: 触发 {self._fired}/{self._turns} 轮, "
+                f"覆盖静音 {self._covered:.1f}s"
+            )
+
+    # ========== 事件 ==========
+
+    def _on_user_input_transcribed(self, event) -> None:
+        if event.is_final:
+            self._turn_pending = True
+
+    def _on_user_state_changed(self, event) -> None:
+        if event.new_state == "speaking":
+            self._cancel_timer()
+            self._stop_playback()
+
+    def _on_agent_state_changed(self, event) -> None:
+        if event.new_state == "thinking":
+            # 只在用户说完之后计时（开场白等主动发言不播放填充音）
+            if self._turn_pending:
+                self._turn_pending = False
+                self._turns += 1
+                self._cancel_timer()
+                self._timer = asyncio.create_task(self._fire_after_delay())
+        else:
+            if self._timer and not self._timer.done():
+                metrics.filler_turn("skipped")
+            self._cancel_timer()
+            self._stop_playback()
+
+    # ========== 播放 ==========
+
+    def _cancel_timer(self) -> None:
+        if self._timer and not self._timer.done():
+            self._timer.cancel()
+        self._timer = None
+
+    def _pick_clip(self) -> FillerClip:
+        candidates = [c for c in self._clips if c.name != self._last_clip] or self._clips
+        clip = random.choice(candidates)
+        self._last_clip = clip.name
+        return clip
+
+    async def _fire_after_delay(self) -> None:
+        await asyncio.sleep(self._delay)
+        if self._play_task and not self._play_task.done():
+            return
+
+        clip = self._pick_clip()
+        self._fired += 1
+        metrics.filler_turn("fired")
+        logger.info(
+            f"✓ 播放填充音 {clip.name!r}: 用户说完 {self._delay * 1000:.0f}ms 后仍未开始回复"
+        )
+        self._handoff.clear()
+        self._rewind_frames = 0
+        self._played_at = time.monotonic()
+        self._played_clip = clip
+        self._play_task = asyncio.create_task(self._play(clip))
+
+    def _stop_playback(self) -> None:
+        """真实回复开始（或用户开口）时淡出填充音，并记录覆盖的静音时长"""
+        if not self._played_clip:
+            return
+        covered = min(time.monotonic() - self._played_at, self._played_clip.duration)
+        self._covered += covered
+        metrics.observe_filler_covered(covered)
+        logger.debug(f"填充音交接: clip={self._played_clip.name!r}, 覆盖静音 {covered:.2f}s")
+        self._played_clip = None
+        # 轨道中已排队的填充音（最多 _SOURCE_QUEUE_MS）会盖在真实回复上，先清空再淡出
+        if self._source:
+            self._rewind_frames = round(self._source.queued_duration * 1000 / _FRAME_MS)
+            self._source.clear_queue()
+        self._handoff.set()
+
+    async def _play(self, clip: FillerClip) -> None:
+        async for frame in self._frames(clip):
+            await self._source.capture_frame(frame)
+
+    async def _frames(self, clip: FillerClip) -> AsyncIterator[rtc.AudioFrame]:
+        fade_frames = max(1, int(FILLER_FADE * 1000 / _FRAME_MS))
+        for i, frame in enumerate(clip.frames):
+            if not self._handoff.is_set():
+                yield frame
+                continue
+
+            # 交接：从被清空的排队帧处（即当前播放位置）开始，在淡出时长内线性衰减后结束
+            i = max(0, i - self._rewind_frames)
+            for j, tail in enumerate(clip.frames[i:i + fade_frames]):
+                pcm = np.frombuffer(tail.data, dtype=np.int16).astype(np.float32)
+                start = 1 - j / fade_frames
+                pcm *= np.linspace(start, start - 1 / fade_frames, len(pcm), endpoint=False)
+                yield rtc.AudioFrame(
+                    data=pcm.astype(np.int16).tobytes(),
+                    sample_rate=tail.sample_rate,
+                    num_channels=1,
+                    samples_per_channel=tail.samples_per_channel,
+                )
+            return
+        # 自然播完
+        if self._played_clip is clip:
+            self._covered += clip.duration
+            metrics.observe_filler_covered(clip.duration)
+            self._played_clip = None
+
+
+# ========== 预合成（离线执行） ==========
+
+async def synthesize(persona: str) -> None:
+    """用角色音色把填充短语合成为 FILLER_AUDIO_DIR/<persona>/*.wav"""
+    from dotenv import load_dotenv
+    from livekit.agents.utils import http_context
+    from livekit.plugins import fishaudio
+
+    load_dotenv(".env.local")
+    reference_id = os.getenv("FISH_REFERENCE_ID")
+    if not reference_id:
+        raise RuntimeError("请设置环境变量 FISH_REFERENCE_ID")
+
+    out_dir = Path(FILLER_AUDIO_DIR, persona)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    http_context._new_session_ctx()
+    try:
+        tts = fishaudio.TTS(
+            reference_id=reference_id,
+            model="s1",
+            sample_rate=FILLER_SAMPLE_RATE,
+            latency_mode="balanced",
+        )
+        for idx, phrase in enumerate(FILLER_PHRASES[persona]):
+            frames = [ev.frame async for ev in tts.synthesize(phrase)]
+            frame = rtc.combine_audio_frames(frames)
+            path = out_dir / f"{idx:02d}.wav"
+            with wave.open(str(path), "wb") as f:
+                f.setnchannels(frame.num_channels)
+                f.setsampwidth(2)
+                f.setframerate(frame.sample_rate)
+                f.writeframes(bytes(frame.data))
+            print(f"✓ {phrase!r}: {frame.duration:.2f}s -> {path}")
+    finally:
+        await http_context._close_http_ctx()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="预合成填充音")
+    parser.add_argument("command", choices=["synthesize"])
+    parser.add_argument("--persona", default="peppa", choices=sorted(FILLER_PHRASES))
+    args = parser.parse_args()
+    if not FILLER_AUDIO_DIR:
+        print("FILLER_AUDIO_DIR 为空，无法保存填充音")
+        sys.exit(1)
+    asyncio.run(synthesize(args.persona))
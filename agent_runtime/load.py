@@ -0,0 +1,265 @@
+"""负载上报 - 基于会话数、事件循环延迟、CPU、VAD 与轮次检测耗时计算 Worker 负载
+
+Worker 的 load_fnc 在主进程中运行，而 VAD、轮次检测和事件循环压力都在
+Job 子进程里。每个 Job 进程通过 LoadReporter 定期把自身指标写入共享目录，
+主进程的 LoadCalculator 汇总后与活跃会话数、进程 CPU 合成一个 0~1 的负载值。
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import tempfile
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+import prometheus_client
+from livekit.agents import AgentServer, llm, utils
+from livekit.agents.utils.hw import get_cpu_monitor
+from livekit.plugins.turn_detector.multilingual import MultilingualModel
+
+from agent_runtime import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# Job 进程指标共享目录：由 Worker 主进程按自身 pid 生成，子进程通过环境变量继承，
+# 同一节点上的多个 Worker 互不干扰
+if "LOAD_STATS_DIR" not in os.environ:
+    os.environ["LOAD_STATS_DIR"] = os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+        f"peppa-agent-load-{os.getpid()}",
+    )
+LOAD_STATS_DIR = os.environ["LOAD_STATS_DIR"]
+# 指标文件超过该时间未更新视为进程已退出（秒）
+STATS_STALE_SECONDS = 5.0
+
+
+@dataclass
+class LoadThresholds:
+    """各项指标达到满载（1.0）时的阈值"""
+    max_sessions: int = int(os.getenv("LOAD_MAX_SESSIONS", "50"))
+    loop_lag_ms: float = float(os.getenv("LOAD_LOOP_LAG_MS", "100"))
+    cpu_percent: float = float(os.getenv("LOAD_CPU_PERCENT", "0.85"))
+    # VAD 单窗口平均推理耗时（正常远低于 1ms，每 32ms 一个窗口）
+    vad_ms: float = float(os.getenv("LOAD_VAD_MS", "8"))
+    # 轮次检测往返耗时（含推理进程 IPC 与排队）
+    eou_ms: float = float(os.getenv("LOAD_EOU_MS", "150"))
+
+
+# 超过该负载后 LiveKit 调度器不再向本 Worker 分配任务
+DEFAULT_LOAD_THRESHOLD = float(os.getenv("WORKER_LOAD_THRESHOLD", "0.75"))
+
+
+LOAD_COMPONENT_GAUGE = prometheus_client.Gauge(
+    "peppa_worker_load_component",
+    "Normalized worker load by component (1.0 = saturated)",
+    ["nodename", "component"],
+    multiprocess_mode="max",
+)
+
+
+# ========== Job 进程侧 ==========
+
+class LoadReporter:
+    """Job 进程负载上报（每个进程一个实例）"""
+
+    _instance: Optional["LoadReporter"] = None
+
+    def __init__(self, interval: float = 0.5, window: int = 10) -> None:
+        self._interval = interval
+        self._loop_lags: deque[float] = deque(maxlen=window)
+        # VAD 与轮次检测量级不同，分开统计
+        self._vad_times: deque[float] = deque(maxlen=window * 4)
+        self._eou_times: deque[float] = deque(maxlen=window * 4)
+        self._sessions = 0
+        self._task: Optional[asyncio.Task] = None
+        self._path = os.path.join(LOAD_STATS_DIR, f"{os.getpid()}.json")
+
+    @classmethod
+    def get(cls) -> "LoadReporter":
+        if cls._instance is None:
+            cls._instance = LoadReporter()
+        return cls._instance
+
+    def start(self) -> None:
+        """启动上报任务（重复调用无副作用）"""
+        if self._task is not None and not self._task.done():
+            return
+        os.makedirs(LOAD_STATS_DIR, exist_ok=True)
+        self._task = asyncio.create_task(self._run())
+
+    def session_started(self) -> None:
+        self._sessions += 1
+        metrics.session_started()
+
+    def session_ended(self) -> None:
+        self._sessions = max(0, self._sessions - 1)
+        metrics.session_ended()
+
+    def record_vad(self, seconds: float) -> None:
+        """记录一个统计窗口内 VAD 的平均推理耗时"""
+        self._vad_times.append(seconds)
+
+    def record_eou(self, seconds: float) -> None:
+        """记录一次轮次检测耗时（含排队时间）"""
+        self._eou_times.append(seconds)
+
+    def on_metrics_collected(self, event) -> None:
+        """AgentSession metrics_collected 回调：采集 VAD 平均推理耗时"""
+        metrics = event.metrics
+        if getattr(metrics, "type", None) == "vad_metrics" and metrics.inference_count:
+            self.record_vad(metrics.inference_duration_total / metrics.inference_count)
+
+    @staticmethod
+    def _p95(values: deque[float]) -> float:
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else 0.0
+
+    def _snapshot(self) -> dict:
+        return {
+            "ts": time.time(),
+            "sessions": self._sessions,
+            "loop_lag_ms": max(self._loop_lags, default=0.0) * 1000,
+            "vad_ms": self._p95(self._vad_times) * 1000,
+            "eou_ms": self._p95(self._eou_times) * 1000,
+        }
+
+    def _write(self) -> None:
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._snapshot(), f)
+        os.replace(tmp_path, self._path)
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                started = time.perf_counter()
+                await asyncio.sleep(self._interval)
+                lag = max(0.0, time.perf_counter() - started - self._interval)
+                self._loop_lags.append(lag)
+                metrics.observe_loop_lag(lag)
+                try:
+                    self._write()
+                except OSError as e:
+                    logger.debug(f"写入负载指标失败: {e}")
+        finally:
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+
+
+class TimedMultilingualModel(MultilingualModel):
+    """记录轮次检测耗时的 MultilingualModel
+
+    耗时包含在推理进程中的排队时间，是推理队列压力的直接反映。
+    """
+
+    async def predict_end_of_turn(
+        self,
+        chat_ctx: llm.ChatContext,
+        *,
+        timeout: Optional[float] = 3,
+    ) -> float:
+        started = time.perf_counter()
+        try:
+            return await super().predict_end_of_turn(chat_ctx, timeout=timeout)
+        finally:
+            LoadReporter.get().record_eou(time.perf_counter() - started)
+
+
+# ========== Worker 主进程侧 ==========
+
+@dataclass
+class LoadSample:
+    sessions: float = 0.0
+    loop_lag: float = 0.0
+    cpu: float = 0.0
+    vad: float = 0.0
+    eou: float = 0.0
+
+    @property
+    def load(self) -> float:
+        return min(1.0, max(self.sessions, self.loop_lag, self.cpu, self.vad, self.eou))
+
+
+class LoadCalculator:
+    """Worker 负载计算（作为 AgentServer 的 load_fnc）
+
+    每项指标按阈值归一化到 0~1，取最大值作为负载：任意一项饱和即视为满载。
+    """
+
+    def __init__(self, thresholds: Optional[LoadThresholds] = None) -> None:
+        self._thresholds = thresholds or LoadThresholds()
+        self._cpu_avg = utils.MovingAverage(5)
+        self._cpu_monitor = get_cpu_monitor()
+        self._lock = threading.Lock()
+        self._cpu_thread: Optional[threading.Thread] = None
+
+    def _ensure_cpu_thread(self) -> None:
+        if self._cpu_thread is None:
+            self._cpu_thread = threading.Thread(
+                target=self._sample_cpu, daemon=True, name="peppa_cpu_load_monitor"
+            )
+            self._cpu_thread.start()
+
+    def _sample_cpu(self) -> None:
+        while True:
+            cpu_p = self._cpu_monitor.cpu_percent(interval=0.5)
+            with self._lock:
+                self._cpu_avg.add_sample(cpu_p)
+
+    def _read_job_stats(self) -> list[dict]:
+        stats = []
+        now = time.time()
+        try:
+            names = os.listdir(LOAD_STATS_DIR)
+        except FileNotFoundError:
+            return stats
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(LOAD_STATS_DIR, name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if now - data.get("ts", 0) <= STATS_STALE_SECONDS:
+                stats.append(data)
+        return stats
+
+    def sample(self, server: AgentServer) -> LoadSample:
+        self._ensure_cpu_thread()
+        t = self._thresholds
+        stats = self._read_job_stats()
+
+        sessions = max(len(server.active_jobs), sum(s.get("sessions", 0) for s in stats))
+        loop_lag_ms = max((s.get("loop_lag_ms", 0.0) for s in stats), default=0.0)
+        vad_ms = max((s.get("vad_ms", 0.0) for s in stats), default=0.0)
+        eou_ms = max((s.get("eou_ms", 0.0) for s in stats), default=0.0)
+        with self._lock:
+            cpu = self._cpu_avg.get_avg()
+
+        return LoadSample(
+            sessions=sessions / t.max_sessions,
+            loop_lag=loop_lag_ms / t.loop_lag_ms,
+            cpu=cpu / t.cpu_percent,
+            vad=vad_ms / t.vad_ms,
+            eou=eou_ms / t.eou_ms,
+        )
+
+    def __call__(self, server: AgentServer) -> float:
+        sample = self.sample(server)
+        nodename = utils.nodename()
+        for component, value in (
+            ("sessions", sample.sessions),
+            ("loop_lag", sample.loop_lag),
+            ("cpu", sample.cpu),
+            ("vad", sample.vad),
+            ("eou", sample.eou),
+        ):
+            LOAD_COMPONENT_GAUGE.labels(nodename=nodename, component=component).set(value)
+        return sample.load
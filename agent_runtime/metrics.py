@@ -0,0 +1,233 @@
+"""运行指标 - Prometheus 直方图 / 仪表 / 计数器
+
+Job 子进程中记录的指标通过 prometheus_client 多进程模式写入 PROMETHEUS_MULTIPROC_DIR，
+由 Worker 主进程在 PROMETHEUS_PORT 的 /metrics 上统一导出。
+
+所有指标都带 nodename 标签，指标值在首次打点时才创建（与 livekit 自带指标一致），
+避免在 Worker 清理多进程目录之前就打开了指标文件。标签子对象会被缓存，
+热路径上的一次打点只是一次字典查找加一次 mmap 写入。
+"""
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Coroutine
+
+import prometheus_client
+from livekit.agents import utils
+
+logger = logging.getLogger(__name__)
+
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+DB_WRITE_LATENCY = prometheus_client.Histogram(
+    "peppa_db_write_duration_seconds",
+    "DB write latency (including commit) by repository method",
+    ["nodename", "method"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+PROVIDER_FIRST_RESULT = prometheus_client.Histogram(
+    "peppa_provider_first_result_seconds",
+    "Time to first result: STT final transcript, LLM first token, TTS first byte",
+    ["nodename", "provider"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+EVENT_LOOP_LAG = prometheus_client.Histogram(
+    "peppa_event_loop_lag_seconds",
+    "Event loop scheduling lag in job processes",
+    ["nodename"],
+    buckets=_LAG_BUCKETS,
+)
+
+ACTIVE_SESSIONS = prometheus_client.Gauge(
+    "peppa_active_sessions",
+    "Active agent sessions",
+    ["nodename"],
+    multiprocess_mode="livesum",
+)
+
+PENDING_BACKGROUND_TASKS = prometheus_client.Gauge(
+    "peppa_pending_background_tasks",
+    "Background tasks (DB writes, etc.) not yet finished",
+    ["nodename"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_CHECKOUTS = prometheus_client.Gauge(
+    "peppa_db_pool_checked_out_connections",
+    "Connections currently checked out of the database pool",
+    ["nodename", "engine"],
+    multiprocess_mode="livesum",
+)
+
+TRANSCRIPT_WRITES_LOST = prometheus_client.Counter(
+    "peppa_transcript_writes_lost_total",
+    "Transcript writes that were dropped or failed",
+    ["nodename", "reason"],
+)
+
+FILLER_TURNS = prometheus_client.Counter(
+    "peppa_filler_turns_total",
+    "User turns where filler audio was played (fired) or not needed (skipped)",
+    ["nodename", "outcome"],
+)
+
+FILLER_COVERED_SILENCE = prometheus_client.Histogram(
+    "peppa_filler_covered_silence_seconds",
+    "Silence covered by filler audio before the real reply started",
+    ["nodename"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+ADMISSION_DECISIONS = prometheus_client.Counter(
+    "peppa_admission_decisions_total",
+    "Job requests by admission decision (normal / degraded / rejected) and reason",
+    ["nodename", "decision", "reason"],
+)
+
+ADMISSION_QUEUE_WAIT = prometheus_client.Histogram(
+    "peppa_admission_queue_wait_seconds",
+    "Time job requests spent in the admission wait queue",
+    ["nodename"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+RESPONSE_CACHE_LOOKUPS = prometheus_client.Counter(
+    "peppa_llm_response_cache_lookups_total",
+    "Eligible LLM requests by response cache result (hit / miss)",
+    ["nodename", "result"],
+)
+
+RESPONSE_CACHE_SAVED = prometheus_client.Histogram(
+    "peppa_llm_response_cache_saved_seconds",
+    "LLM time to first token avoided by response cache hits",
+    ["nodename"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+
+@lru_cache(maxsize=None)
+def _child(metric: Any, *labels: str) -> Any:
+    return metric.labels(utils.nodename(), *labels)
+
+
+# ========== 数据库 ==========
+
+@asynccontextmanager
+async def db_write(method: str) -> AsyncIterator[None]:
+    """记录一次数据库写入耗时（包裹仓库方法调用和 commit）"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _child(DB_WRITE_LATENCY, method).observe(time.perf_counter() - started)
+
+
+def instrument_engine(engine: Any, name: str = "default") -> None:
+    """监听连接池 checkout / checkin 事件，统计已借出的连接数"""
+    from sqlalchemy import event
+
+    pool = engine.sync_engine.pool
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(*_):
+        _child(DB_POOL_CHECKOUTS, name).inc()
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(*_):
+        _child(DB_POOL_CHECKOUTS, name).dec()
+
+
+def transcript_write_lost(reason: str) -> None:
+    """对话记录写入丢弃（dropped）或失败（failed）"""
+    _child(TRANSCRIPT_WRITES_LOST, reason).inc()
+
+
+# ========== 会话与事件循环 ==========
+
+def session_started() -> None:
+    _child(ACTIVE_SESSIONS).inc()
+
+
+def session_ended() -> None:
+    _child(ACTIVE_SESSIONS).dec()
+
+
+def observe_loop_lag(seconds: float) -> None:
+    _child(EVENT_LOOP_LAG).observe(seconds)
+
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+def background_task(coro: Coroutine) -> asyncio.Task:
+    """创建后台任务并计入 pending 指标（同时持有任务引用，避免被提前回收）"""
+    task = asyncio.create_task(coro)
+    gauge = _child(PENDING_BACKGROUND_TASKS)
+    gauge.inc()
+    _background_tasks.add(task)
+
+    def _done(t: asyncio.Task) -> None:
+        gauge.dec()
+        _background_tasks.discard(t)
+
+    task.add_done_callback(_done)
+    return task
+
+
+async def wait_background_tasks() -> None:
+    """等待所有后台任务结束（包括等待期间新创建的任务）"""
+    while _background_tasks:
+        await asyncio.gather(*list(_background_tasks), return_exceptions=True)
+
+
+# ========== 填充音 ==========
+
+def filler_turn(outcome: str) -> None:
+    """用户轮次的填充音结果：fired（已播放）或 skipped（回复足够快）"""
+    _child(FILLER_TURNS, outcome).inc()
+
+
+def observe_filler_covered(seconds: float) -> None:
+    _child(FILLER_COVERED_SILENCE).observe(seconds)
+
+
+# ========== 准入控制（Worker 主进程） ==========
+
+def admission_decision(decision: str, reason: str) -> None:
+    """任务准入结果：normal / degraded（已接受）或 rejected"""
+    _child(ADMISSION_DECISIONS, decision, reason).inc()
+
+
+def observe_admission_wait(seconds: float) -> None:
+    _child(ADMISSION_QUEUE_WAIT).observe(seconds)
+
+
+# ========== LLM 回复缓存 ==========
+
+def response_cache_lookup(result: str) -> None:
+    """符合缓存条件的 LLM 请求：hit（返回缓存回复）或 miss（调用 LLM）"""
+    _child(RESPONSE_CACHE_LOOKUPS, result).inc()
+
+
+def observe_response_cache_saved(seconds: float) -> None:
+    _child(RESPONSE_CACHE_SAVED).observe(seconds)
+
+
+# ========== STT / LLM / TTS ==========
+
+def on_metrics_collected(event: Any) -> None:
+    """AgentSession metrics_collected 回调：记录各 provider 首个结果的耗时"""
+    metrics = event.metrics
+    metrics_type = getattr(metrics, "type", None)
+    if metrics_type == "llm_metrics" and not metrics.cancelled and metrics.ttft >= 0:
+        _child(PROVIDER_FIRST_RESULT, "llm").observe(metrics.ttft)
+    elif metrics_type == "tts_metrics" and not metrics.cancelled and metrics.ttfb >= 0:
+        _child(PROVIDER_FIRST_RESULT, "tts").observe(metrics.ttfb)
+    elif metrics_type == "eou_metrics" and metrics.transcription_delay >= 0:
+        _child(PROVIDER_FIRST_RESULT, "stt").observe(metrics.transcription_delay)
@@ -0,0 +1,92 @@
+"""房间回收 - 定期批量关闭过期的 active 房间"""
+import os
+import asyncio
+import logging
+
+from database import AsyncSessionLocal, RoomRepository, ChatCheckpointRepository
+from agent_runtime import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# 回收间隔（秒）
+DEFAULT_REAPER_INTERVAL = float(os.getenv("ROOM_REAPER_INTERVAL_SECONDS", "60"))
+# 单批关闭的房间数
+DEFAULT_REAPER_BATCH_SIZE = int(os.getenv("ROOM_REAPER_BATCH_SIZE", "100"))
+# 宽限时间（分钟），给 Agent 自行关闭留出余量
+DEFAULT_REAPER_GRACE_MINUTES = int(os.getenv("ROOM_REAPER_GRACE_MINUTES", "2"))
+
+
+async def reap_stale_rooms(
+    batch_size: int = DEFAULT_REAPER_BATCH_SIZE,
+    grace_minutes: int = DEFAULT_REAPER_GRACE_MINUTES,
+) -> int:
+    """执行一轮回收，按批提交直到没有过期房间
+
+    Returns:
+        int: 本轮关闭的房间总数
+    """
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            try:
+                async with metrics.db_write("RoomRepository.close_stale_rooms"):
+                    closed = await RoomRepository.close_stale_rooms(
+                        db, batch_size=batch_size, grace_minutes=grace_minutes
+                    )
+                    await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        total += closed
+        if closed < batch_size:
+            return total
+
+
+async def purge_closed_checkpoints(batch_size: int = DEFAULT_REAPER_BATCH_SIZE) -> int:
+    """删除已关闭房间的对话检查点，按批提交直到删完
+
+    Returns:
+        int: 本轮删除的检查点总数
+    """
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            try:
+                async with metrics.db_write("ChatCheckpointRepository.delete_for_closed_rooms"):
+                    deleted = await ChatCheckpointRepository.delete_for_closed_rooms(
+                        db, batch_size=batch_size
+                    )
+                    await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+
+async def run_room_reaper(
+    interval: float = DEFAULT_REAPER_INTERVAL,
+    batch_size: int = DEFAULT_REAPER_BATCH_SIZE,
+    grace_minutes: int = DEFAULT_REAPER_GRACE_MINUTES,
+) -> None:
+    """定期回收过期房间（在 Worker 主进程中运行）"""
+    logger.info(
+        f"✓ 房间回收任务已启动: interval={interval}s, "
+        f"batch_size={batch_size}, grace={grace_minutes}min"
+    )
+    while True:
+        try:
+            closed = await reap_stale_rooms(batch_size, grace_minutes)
+            if closed:
+                logger.info(f"✓ 已回收 {closed} 个过期房间")
+        except Exception as e:
+            logger.error(f"回收过期房间失败: {e}", exc_info=True)
+        try:
+            purged = await purge_closed_checkpoints(batch_size)
+            if purged:
+                logger.info(f"✓ 已清理 {purged} 个已关闭房间的对话检查点")
+        except Exception as e:
+            logger.error(f"清理对话检查点失败: {e}", exc_info=True)
+        await asyncio.sleep(interval)
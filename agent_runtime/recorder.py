@@ -0,0 +1,149 @@
+"""会话录制 - 记录一次会话的事件时间线，供 benchmarks.session_replay 回放
+
+记录内容：参与者进出、用户转写（含 EOU / 转写延迟）、对话条目（用户输入与 LLM 输出）、
+LLM 首 token 耗时、TTS 首字节耗时与音频时长、Agent / 用户状态变化。
+不录制音频。每个事件带相对会话开始的时间偏移 t（秒），会话结束时写入
+SESSION_RECORDINGS_DIR/<room_name>-<job_id>.json。
+
+未设置 SESSION_RECORDINGS_DIR 时不录制；SESSION_RECORDING_SAMPLE_RATE 控制录制比例。
+录制文件包含对话原文，与 ai_voice_conversations 表按同样的数据要求保管。
+"""
+import os
+import json
+import time
+import random
+import logging
+from typing import Any, Optional
+
+from livekit import rtc
+from livekit.agents import AgentSession
+
+logger = logging.getLogger(__name__)
+
+
+RECORDING_VERSION = 1
+
+# 录制文件目录（未设置时不录制）
+RECORDINGS_DIR = os.getenv("SESSION_RECORDINGS_DIR") or None
+# 录制比例（0~1）
+RECORDING_SAMPLE_RATE = float(os.getenv("SESSION_RECORDING_SAMPLE_RATE", "1.0"))
+
+
+def _text(item: Any) -> str:
+    content = getattr(item, "content", None)
+    if isinstance(content, list):
+        return " ".join(c for c in content if isinstance(c, str))
+    return content if isinstance(content, str) else ""
+
+
+class SessionRecorder:
+    """会话事件时间线录制器（每个会话一个实例）"""
+
+    def __init__(self, room_name: str, job_id: str, metadata: str = ""):
+        self._room_name = room_name
+        self._job_id = job_id
+        self._metadata = metadata
+        self._started_at = time.time()
+        self._started = time.monotonic()
+        self._events: list[dict] = []
+
+    @classmethod
+    def create(cls, room_name: str, job_id: str, metadata: str = "") -> Optional["SessionRecorder"]:
+        """按配置与采样率创建录制器，不录制时返回 None"""
+        if not RECORDINGS_DIR or random.random() >= RECORDING_SAMPLE_RATE:
+            return None
+        return cls(room_name, job_id, metadata)
+
+    def record(self, event_type: str, **fields: Any) -> None:
+        self._events.append({
+            "t": round(time.monotonic() - self._started, 4),
+            "type": event_type,
+            **fields,
+        })
+
+    def attach(self, session: AgentSession, room: rtc.Room) -> None:
+        """注册会话与房间事件（在 session.start() 之前调用）"""
+        for participant in room.remote_participants.values():
+            self.record("participant_connected", identity=participant.identity, existing=True)
+
+        room.on(
+            "participant_connected",
+            lambda p: self.record("participant_connected", identity=p.identity),
+        )
+        room.on(
+            "participant_disconnected",
+            lambda p: self.record("participant_disconnected", identity=p.identity),
+        )
+
+        session.on("user_state_changed", lambda ev: self.record("user_state", state=ev.new_state))
+        session.on("agent_state_changed", lambda ev: self.record("agent_state", state=ev.new_state))
+        session.on("user_input_transcribed", self._on_user_input_transcribed)
+        session.on("conversation_item_added", self._on_conversation_item_added)
+        session.on("metrics_collected", self._on_metrics_collected)
+        session.on("close", lambda ev: self.record("close", reason=str(ev.reason)))
+
+    def _on_user_input_transcribed(self, ev: Any) -> None:
+        if ev.is_final:
+            self.record("user_transcript", text=ev.transcript)
+
+    def _on_conversation_item_added(self, ev: Any) -> None:
+        item = ev.item
+        role = getattr(item, "role", None)
+        if role not in ("user", "assistant"):
+            return
+        self.record(
+            "conversation_item",
+            role=role,
+            text=_text(item),
+            interrupted=bool(getattr(item, "interrupted", False)),
+        )
+
+    def _on_metrics_collected(self, ev: Any) -> None:
+        m = ev.metrics
+        metrics_type = getattr(m, "type", None)
+        if metrics_type == "llm_metrics":
+            self.record(
+                "llm",
+                ttft=m.ttft,
+                duration=m.duration,
+                completion_tokens=m.completion_tokens,
+                cancelled=m.cancelled,
+            )
+        elif metrics_type == "tts_metrics":
+            self.record(
+                "tts",
+                ttfb=m.ttfb,
+                duration=m.duration,
+                audio_duration=m.audio_duration,
+                characters=m.characters_count,
+                cancelled=m.cancelled,
+            )
+        elif metrics_type == "eou_metrics":
+            self.record(
+                "eou",
+                end_of_utterance_delay=m.end_of_utterance_delay,
+                transcription_delay=m.transcription_delay,
+            )
+
+    def save(self) -> Optional[str]:
+        """写入录制文件，返回文件路径"""
+        if not self._events:
+            return None
+        os.makedirs(RECORDINGS_DIR, exist_ok=True)
+        path = os.path.join(RECORDINGS_DIR, f"{self._room_name}-{self._job_id}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "version": RECORDING_VERSION,
+                    "room_name": self._room_name,
+                    "metadata": self._metadata,
+                    "started_at": self._started_at,
+                    "events": self._events,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, path)
+        logger.info(f"✓ 已保存会话录制: {path}（{len(self._events)} 个事件）")
+        return path
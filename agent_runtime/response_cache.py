@@ -0,0 +1,341 @@
+"""LLM 回复缓存 - 孩子开口第一句常问的问题直接返回缓存的回复
+
+"What's your favourite colour?"、"Where's George?" 这类问题每次都是一次完整的 LLM 调用。
+CachedLLM 包在 openai.LLM 外面，只对满足以下条件的请求生效：
+
+- 会话的第一轮用户输入：之后的回复可能依赖前文（"I'm Tom" 之后问 "What's my name?"），
+  放进节点共享的缓存会答错并把一个孩子的信息泄露给其他孩子。是否第一轮按 Agent 的完整
+  对话上下文判断（bind_history），LLM 请求的上下文在降级模式下会被截断，不能作为依据；
+- 最后一条是用户输入，且归一化后（小写、去标点和语气词）不超过 LLM_RESPONSE_CACHE_MAX_WORDS 个词；
+- 请求不带工具。
+
+缓存键 = 角色 + 系统指令摘要 + 上一条 Agent 发言（通常是开场白）的摘要 + 归一化后的用户输入。
+第一轮通常是在回答开场白里的问题，"yes"、"blue" 这样的短回复只有在同一个问题下才能共用回复；
+注入了回访用户画像的会话指令不同，不会与其他孩子共用回复。每个键保存最多 LLM_RESPONSE_CACHE_POOL_SIZE 条不同的回复：
+回复池未满时照常调用 LLM 并把完整回复（未被打断）放入池中，池满后随机返回一条，
+同一会话内不连续重复，避免听起来千篇一律。回复超过 LLM_RESPONSE_CACHE_TTL_SECONDS 后过期，
+键的数量超过 LLM_RESPONSE_CACHE_MAX_ENTRIES 时按最近使用时间淘汰。
+
+每个 Job 是独立的进程，缓存以文件形式放在节点共享目录（默认 /dev/shm），同一节点的所有
+Worker 共用。默认关闭，设置 LLM_RESPONSE_CACHE=1 启用。
+"""
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import tempfile
+import dataclasses
+from typing import Any, Callable, Optional
+
+from livekit.agents import DEFAULT_API_CONNECT_OPTIONS, APIConnectOptions, llm, utils
+
+from agent_runtime import metrics
+
+logger = logging.getLogger(__name__)
+
+
+LLM_RESPONSE_CACHE = os.getenv("LLM_RESPONSE_CACHE", "").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_DIR = os.getenv(
+    "LLM_RESPONSE_CACHE_DIR",
+    os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+        "peppa-agent-response-cache",
+    ),
+)
+# 回复的有效期（秒）
+RESPONSE_CACHE_TTL = float(os.getenv("LLM_RESPONSE_CACHE_TTL_SECONDS", "21600"))
+# 缓存键数量上限（超过后按最近使用时间淘汰）
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("LLM_RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+# 每个键保存的不同回复数，回复池满后才开始命中
+RESPONSE_CACHE_POOL_SIZE = int(os.getenv("LLM_RESPONSE_CACHE_POOL_SIZE", "3"))
+# 归一化后用户输入的最多词数
+RESPONSE_CACHE_MAX_WORDS = int(os.getenv("LLM_RESPONSE_CACHE_MAX_WORDS", "8"))
+
+# 归一化时去掉的语气词
+_FILLER_WORDS = {"um", "umm", "uh", "uhh", "erm", "er", "hmm", "ah", "oh"}
+_NON_WORD = re.compile(r"[^a-z0-9' ]+")
+
+
+def normalize_utterance(text: str) -> str:
+    """小写、统一撇号、去掉标点和语气词，用作缓存键"""
+    text = text.lower().replace("’", "'")
+    words = _NON_WORD.sub(" ", text).split()
+    return " ".join(w for w in words if w not in _FILLER_WORDS)
+
+
+class ResponseCache:
+    """节点共享的回复缓存（每个键一个 JSON 文件，原子替换写入）
+
+    多个进程同时向同一个回复池追加时可能丢掉其中一条，下次未命中时会补上。
+    """
+
+    def __init__(
+        self,
+        directory: str = RESPONSE_CACHE_DIR,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        pool_size: int = RESPONSE_CACHE_POOL_SIZE,
+    ) -> None:
+        self._directory = directory
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self.pool_size = pool_size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, f"{hashlib.sha1(key.encode()).hexdigest()}.json")
+
+    def _read(self, path: str) -> list[dict]:
+        try:
+            with open(path) as f:
+                responses = json.load(f)["responses"]
+        except (OSError, ValueError, KeyError):
+            return []
+        now = time.time()
+        return [r for r in responses if now - r["ts"] < self._ttl]
+
+    def lookup(self, key: str) -> list[dict]:
+        """返回键下未过期的回复（热路径：一次小文件读取）"""
+        path = self._path(key)
+        responses = self._read(path)
+        if responses:
+            try:
+                # 更新修改时间，淘汰时按最近使用排序
+                os.utime(path)
+            except OSError:
+                pass
+        return responses
+
+    def store(self, key: str, text: str, ttft: float) -> None:
+        """把一条完整回复加入回复池（在线程中执行）"""
+        os.makedirs(self._directory, exist_ok=True)
+        path = self._path(key)
+        is_new = not os.path.exists(path)
+        responses = self._read(path)
+        if any(r["text"] == text for r in responses):
+            return
+        responses = (responses + [{"text": text, "ttft": ttft, "ts": time.time()}])[-self.pool_size:]
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"key": key, "responses": responses}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        if is_new:
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        with os.scandir(self._directory) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        continue
+        if len(entries) <= self._max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self._max_entries]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+class _CachedLLMStream(llm.LLMStream):
+    def __init__(
+        self,
+        cached_llm: "CachedLLM",
+        *,
+        key: Optional[str],
+        cached_text: Optional[str],
+        chat_ctx: llm.ChatContext,
+        tools: list,
+        conn_options: APIConnectOptions,
+        chat_kwargs: dict,
+    ) -> None:
+        # 重试由内层 LLM 负责
+        super().__init__(
+            cached_llm,
+            chat_ctx=chat_ctx,
+            tools=tools,
+            conn_options=dataclasses.replace(conn_options, max_retry=0),
+        )
+        self._cached_llm = cached_llm
+        self._key = key
+        self._cached_text = cached_text
+        self._inner_conn_options = conn_options
+        self._chat_kwargs = chat_kwargs
+
+    async def _run(self) -> None:
+        if self._cached_text is not None:
+            request_id = utils.shortuuid("cache_")
+            for piece in re.findall(r"\S+\s*", self._cached_text):
+                self._event_ch.send_nowait(
+                    llm.ChatChunk(
+                        id=request_id,
+                        delta=llm.ChoiceDelta(role="assistant", content=piece),
+                    )
+                )
+            return
+
+        started = time.perf_counter()
+        ttft: Optional[float] = None
+        parts: list[str] = []
+        cacheable = self._key is not None
+        stream = self._cached_llm.inner.chat(
+            chat_ctx=self._chat_ctx,
+            tools=self._tools,
+            conn_options=self._inner_conn_options,
+            **self._chat_kwargs,
+        )
+        try:
+            async for chunk in stream:
+                if chunk.delta:
+                    if chunk.delta.tool_calls:
+                        cacheable = False
+                    if chunk.delta.content:
+                        if ttft is None:
+                            ttft = time.perf_counter() - started
+                        parts.append(chunk.delta.content)
+                self._event_ch.send_nowait(chunk)
+        finally:
+            await stream.aclose()
+
+        # 只缓存完整生成的回复（被打断时任务在上面已取消）
+        text = "".join(parts).strip()
+        if cacheable and text and ttft is not None:
+            metrics.background_task(self._store(text, ttft))
+
+    async def _store(self, text: str, ttft: float) -> None:
+        try:
+            await asyncio.to_thread(self._cached_llm.cache.store, self._key, text, ttft)
+        except Exception as e:
+            logger.warning(f"⚠️  写入回复缓存失败: {e}")
+
+
+class CachedLLM(llm.LLM):
+    """在 LLM 前加一层常见问题回复缓存（每个会话一个实例）"""
+
+    def __init__(
+        self,
+        inner: llm.LLM,
+        persona: str,
+        cache: Optional[ResponseCache] = None,
+        max_words: int = RESPONSE_CACHE_MAX_WORDS,
+    ) -> None:
+        super().__init__()
+        self.inner = inner
+        self.cache = cache or ResponseCache()
+        self._persona = persona
+        self._max_words = max_words
+        # 本会话每个键上次返回的回复，避免连续重复
+        self._last_served: dict[str, str] = {}
+        self._history: Optional[Callable[[], llm.ChatContext]] = None
+
+    def bind_history(self, history: Callable[[], llm.ChatContext]) -> None:
+        """设置会话完整对话上下文的来源（创建 AgentSession 之后调用）"""
+        self._history = history
+
+    @property
+    def model(self) -> str:
+        return self.inner.model
+
+    @property
+    def provider(self) -> str:
+        return self.inner.provider
+
+    def _cache_key(
+        self,
+        chat_ctx: llm.ChatContext,
+        tools: list,
+        history: Optional[llm.ChatContext] = None,
+    ) -> Optional[str]:
+        """符合缓存条件时返回缓存键，否则返回 None
+
+        history 为会话的完整对话上下文（未截断，可能还不含本轮用户输入），
+        为 None 时按请求的上下文判断。
+        """
+        if tools or not chat_ctx.items:
+            return None
+        last = chat_ctx.items[-1]
+        if last.type != "message" or last.role != "user":
+            return None
+
+        # 只缓存第一轮用户输入：本轮之前没有任何用户发言
+        earlier = [
+            item
+            for item in (history.items if history is not None else chat_ctx.items)
+            if item.type == "message" and item.id != last.id
+        ]
+        if any(m.role == "user" for m in earlier):
+            return None
+        previous = next((m for m in reversed(earlier) if m.role == "assistant"), None)
+        prompt = normalize_utterance(previous.text_content or "") if previous else ""
+
+        # 称呼角色名（"Peppa, where's George?"）不影响回复
+        utterance = " ".join(
+            w for w in normalize_utterance(last.text_content or "").split() if w != self._persona
+        )
+        if not utterance or len(utterance.split()) > self._max_words:
+            return None
+
+        instructions = "\n".join(
+            item.text_content or ""
+            for item in chat_ctx.items
+            if item.type == "message" and item.role in ("system", "developer")
+        )
+        digest = hashlib.sha1(instructions.encode()).hexdigest()[:16]
+        prompt_digest = hashlib.sha1(prompt.encode()).hexdigest()[:16]
+        return f"{self._persona}:{digest}:{prompt_digest}:{utterance}"
+
+    def chat(
+        self,
+        *,
+        chat_ctx: llm.ChatContext,
+        tools: Optional[list] = None,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+        **kwargs: Any,
+    ) -> llm.LLMStream:
+        tools = tools or []
+        key = self._cache_key(chat_ctx, tools, self._history() if self._history else None)
+        cached_text = None
+
+        if key is not None:
+            try:
+                responses = self.cache.lookup(key)
+            except Exception as e:
+                logger.warning(f"⚠️  读取回复缓存失败: {e}")
+                responses = []
+
+            if len(responses) >= self.cache.pool_size:
+                candidates = [
+                    r for r in responses if r["text"] != self._last_served.get(key)
+                ] or responses
+                chosen = random.choice(candidates)
+                cached_text = chosen["text"]
+                self._last_served[key] = cached_text
+                metrics.response_cache_lookup("hit")
+                metrics.observe_response_cache_saved(chosen["ttft"])
+                logger.info(
+                    f"✓ 命中回复缓存: {key.rsplit(':', 1)[-1]!r}, "
+                    f"节省首 token 延迟约 {chosen['ttft'] * 1000:.0f}ms"
+                )
+            else:
+                metrics.response_cache_lookup("miss")
+
+        return _CachedLLMStream(
+            self,
+            key=key,
+            cached_text=cached_text,
+            chat_ctx=chat_ctx,
+            tools=tools,
+            conn_options=conn_options,
+            chat_kwargs=kwargs,
+        )
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
@@ -0,0 +1,228 @@
+"""会话守护 - 执行房间超时与静默空闲策略"""
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from livekit import agents
+from livekit.agents import AgentSession
+
+from database import AsyncSessionLocal, RoomRepository
+from agent_runtime import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# 静默空闲超时（秒）：用户和 Agent 都没有说话超过该时间则关闭会话
+DEFAULT_IDLE_TIMEOUT = float(os.getenv("ROOM_IDLE_TIMEOUT_SECONDS", "90"))
+# 空房间超时（秒）：房间内没有用户超过该时间则关闭会话
+DEFAULT_EMPTY_TIMEOUT = float(os.getenv("ROOM_EMPTY_TIMEOUT_SECONDS", "60"))
+# 检查间隔（秒）
+DEFAULT_CHECK_INTERVAL = float(os.getenv("ROOM_GUARD_CHECK_INTERVAL_SECONDS", "5"))
+
+
+class SessionGuard:
+    """会话守护
+
+    负责三类关闭条件：
+    - 房间超时：超过 Room.timeout_minutes（从 Room.user_joined_at 起算，同一房间重启或
+      恢复的 Job 不会重新计时；数据库还没有加入时间时从本进程首次看到用户起算）
+    - 静默空闲：用户和 Agent 持续 idle_timeout 秒都没有说话
+    - 空房间：房间内持续 empty_timeout 秒没有用户
+
+    任一条件满足后关闭 AgentSession（停止 STT/VAD/LLM/TTS），
+    用一次 UPDATE 将房间标记为 closed，然后结束当前 Job。
+    会话因其他原因关闭（最常见的是用户断开连接）时同样标记房间关闭并结束 Job。
+    房间在数据库中已不是 active 状态时立即关闭会话并结束 Job。
+    """
+
+    def __init__(
+        self,
+        ctx: agents.JobContext,
+        session: AgentSession,
+        room_name: str,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        empty_timeout: float = DEFAULT_EMPTY_TIMEOUT,
+        check_interval: float = DEFAULT_CHECK_INTERVAL,
+    ) -> None:
+        self._ctx = ctx
+        self._session = session
+        self._room_name = room_name
+        self._idle_timeout = idle_timeout
+        self._empty_timeout = empty_timeout
+        self._check_interval = check_interval
+
+        self._timeout_seconds: Optional[float] = None
+        self._started_at: Optional[float] = None
+        self._last_activity = time.monotonic()
+        # 启动时房间内还没有用户，同样按空房间计时
+        self._empty_since: Optional[float] = time.monotonic()
+        self._user_speaking = False
+        self._agent_busy = False
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def touch(self) -> None:
+        """记录一次活动，重置空闲计时"""
+        self._last_activity = time.monotonic()
+
+    def user_joined(self) -> None:
+        """用户进入房间：数据库没有加入时间时，房间超时从本进程首次看到用户开始计算"""
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        self._empty_since = None
+        self.touch()
+
+    def user_left(self, has_users: bool) -> None:
+        """用户离开房间，房间内已没有用户时开始空房间计时"""
+        if not has_users and self._empty_since is None:
+            self._empty_since = time.monotonic()
+
+    def attach(self) -> None:
+        """注册会话事件监听（需在 session.start() 之前调用）"""
+
+        @self._session.on("user_state_changed")
+        def _on_user_state_changed(event):
+            self._user_speaking = event.new_state == "speaking"
+            # 只有开口说话算作活动（用户长时间沉默后的 away 不能推迟空闲超时）
+            if self._user_speaking:
+                self.touch()
+
+        @self._session.on("agent_state_changed")
+        def _on_agent_state_changed(event):
+            self._agent_busy = event.new_state in ("thinking", "speaking")
+            self.touch()
+
+        @self._session.on("user_input_transcribed")
+        def _on_user_input_transcribed(event):
+            self.touch()
+
+        @self._session.on("close")
+        def _on_session_close(event):
+            # 由 close() 主动关闭时，检查任务正在执行关闭流程，不需要处理
+            if self._closed:
+                return
+            self._closed = True
+            if self._task and not self._task.done():
+                self._task.cancel()
+            # 会话已关闭（如用户断开连接），不需要再 aclose，只标记房间关闭并结束 Job
+            reason = str(getattr(event.reason, "value", event.reason))
+            metrics.background_task(self._finish(reason))
+
+    def start(self) -> None:
+        """启动检查任务（房间配置在任务中读取，不阻塞开场白）"""
+        self._task = asyncio.create_task(self._run())
+
+    async def _load_room(self) -> bool:
+        """读取房间状态与超时配置，房间已不是 active 状态时返回 False"""
+        try:
+            async with AsyncSessionLocal() as db:
+                room = await RoomRepository.get_by_name(db, self._room_name)
+        except Exception as e:
+            logger.error(f"读取房间超时配置失败（仅启用空闲策略）: {e}", exc_info=True)
+            return True
+        if not room:
+            return True
+
+        if room.status != "active":
+            logger.warning(f"⚠️  房间 {self._room_name} 状态为 {room.status}，立即结束会话")
+            return False
+        if room.timeout_minutes:
+            self._timeout_seconds = room.timeout_minutes * 60
+        if room.user_joined_at:
+            # 换算到本进程的单调时钟（datetime.now() 与写入 user_joined_at 时一致）
+            elapsed = max(0.0, (datetime.now() - room.user_joined_at).total_seconds())
+            self._started_at = time.monotonic() - elapsed
+        return True
+
+    def _check(self) -> Optional[str]:
+        """检查关闭条件，返回关闭原因"""
+        now = time.monotonic()
+
+        if self._user_speaking or self._agent_busy:
+            self._last_activity = now
+
+        if (
+            self._timeout_seconds
+            and self._started_at is not None
+            and now - self._started_at >= self._timeout_seconds
+        ):
+            return "room_timeout"
+        if self._empty_since is not None and now - self._empty_since >= self._empty_timeout:
+            return "room_empty"
+        if now - self._last_activity >= self._idle_timeout:
+            return "idle_timeout"
+        return None
+
+    async def _run(self) -> None:
+        if not await self._load_room():
+            await self._shutdown_closed_room()
+            return
+
+        logger.info(
+            f"✓ 会话守护已启动，房间: {self._room_name}, "
+            f"timeout={self._timeout_seconds}s, idle={self._idle_timeout}s, "
+            f"empty={self._empty_timeout}s"
+        )
+        # 恢复的 Job 房间可能已经超时，先检查一次
+        while not self._closed:
+            reason = self._check()
+            if reason:
+                await self.close(reason)
+                break
+            await asyncio.sleep(self._check_interval)
+
+    async def _shutdown_closed_room(self) -> None:
+        """房间已关闭：停止会话并结束 Job，不再写数据库"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self._session.aclose()
+        except Exception as e:
+            logger.error(f"关闭 AgentSession 失败: {e}", exc_info=True)
+        self._ctx.shutdown(reason="room_closed")
+
+    async def close(self, reason: str) -> None:
+        """关闭会话并标记房间关闭（只执行一次）"""
+        if self._closed:
+            return
+        self._closed = True
+
+        logger.info(f"关闭会话，房间: {self._room_name}，原因: {reason}")
+
+        # 先停止所有 provider 流，再写数据库
+        try:
+            await self._session.aclose()
+        except Exception as e:
+            logger.error(f"关闭 AgentSession 失败: {e}", exc_info=True)
+
+        await self._finish(reason)
+
+    async def _finish(self, reason: str) -> None:
+        """用一次 UPDATE 标记房间关闭，然后结束当前 Job"""
+        try:
+            async with AsyncSessionLocal() as db:
+                try:
+                    async with metrics.db_write("RoomRepository.close_room"):
+                        closed = await RoomRepository.close_room(
+                            db, self._room_name, closed_at=datetime.now()
+                        )
+                        await db.commit()
+                    if closed:
+                        logger.info(f"✓ 已关闭房间 {self._room_name}，原因: {reason}")
+                    else:
+                        logger.debug(f"房间 {self._room_name} 已关闭或不存在，跳过更新")
+                except Exception as e:
+                    logger.error(f"标记房间关闭失败: {e}", exc_info=True)
+                    await db.rollback()
+        except Exception as e:
+            logger.error(f"数据库连接失败: {e}", exc_info=True)
+
+        self._ctx.shutdown(reason=reason)
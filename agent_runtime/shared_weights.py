@@ -0,0 +1,234 @@
+"""共享模型权重 - 通过只读内存映射在同一节点的所有 Job 进程间共享 ONNX 权重
+
+默认情况下每个进程创建 InferenceSession 时都会把模型权重复制到自己的堆内存，
+常驻内存随并发 Job 数线性增长。这里把权重拆成单独的 .weights 文件（64 字节对齐），
+加载时用只读 np.memmap 映射并通过 SessionOptions.add_initializer 交给 ONNX Runtime
+直接使用，权重页只在页缓存中存在一份，所有进程共享。
+
+准备（每个节点执行一次，和 download-files 一起放在镜像构建阶段，需要安装 onnx）:
+    python -m agent_runtime.shared_weights prepare
+
+未准备时 load_session() 返回 None，调用方回退到原有加载方式。
+"""
+import os
+import sys
+import json
+import logging
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+import onnxruntime
+
+logger = logging.getLogger(__name__)
+
+
+SHARED_WEIGHTS_DIR = Path(
+    os.getenv(
+        "SHARED_WEIGHTS_DIR",
+        os.path.join(os.path.expanduser("~"), ".cache", "peppa-agent", "weights"),
+    )
+)
+# 权重在文件中的对齐字节数
+WEIGHTS_ALIGNMENT = 64
+
+SILERO_VAD = "silero_vad"
+TURN_DETECTOR = "turn_detector_multilingual"
+
+
+def _paths(name: str) -> tuple[Path, Path, Path]:
+    return (
+        SHARED_WEIGHTS_DIR / f"{name}.onnx",
+        SHARED_WEIGHTS_DIR / f"{name}.weights",
+        SHARED_WEIGHTS_DIR / f"{name}.json",
+    )
+
+
+def is_prepared(name: str) -> bool:
+    return all(p.exists() for p in _paths(name))
+
+
+def load_session(
+    name: str,
+    sess_options: Optional[onnxruntime.SessionOptions] = None,
+    providers: Optional[list[str]] = None,
+) -> Optional[onnxruntime.InferenceSession]:
+    """以共享权重方式创建 InferenceSession，未准备时返回 None"""
+    if not is_prepared(name):
+        return None
+
+    model_path, weights_path, manifest_path = _paths(name)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    sess_options = sess_options or onnxruntime.SessionOptions()
+    # 预打包会为权重生成进程私有的副本，共享权重时必须关闭
+    sess_options.add_session_config_entry("session.disable_prepacking", "1")
+
+    # OrtValue 和 memmap 的生命周期必须覆盖 session，挂在 session 上一起保留
+    keep_alive: list[Any] = []
+    for tensor in manifest["initializers"]:
+        array = np.memmap(
+            weights_path,
+            dtype=np.dtype(tensor["dtype"]),
+            mode="r",
+            offset=tensor["offset"],
+            shape=tuple(tensor["shape"]),
+        )
+        value = onnxruntime.OrtValue.ortvalue_from_numpy(array)
+        sess_options.add_initializer(tensor["name"], value)
+        keep_alive.append((array, value))
+
+    session = onnxruntime.InferenceSession(
+        str(model_path),
+        sess_options=sess_options,
+        providers=providers or ["CPUExecutionProvider"],
+    )
+    session._shared_weights = keep_alive
+    logger.info(
+        f"✓ 已通过共享内存映射加载模型 {name}: "
+        f"{len(keep_alive)} 个权重, {weights_path.stat().st_size / 1024 / 1024:.1f}MB"
+    )
+    return session
+
+
+# ========== 准备阶段（离线执行） ==========
+
+def _hoist_constants(model: Any) -> None:
+    """把主图和子图中的 Constant 节点提升为主图 initializer
+
+    ONNX Runtime 只允许替换主图 initializer，Silero 等模型把权重放在
+    If 子图的 Constant 节点里，需要先提升到主图（子图可以引用外层作用域的值）。
+    """
+    from onnx import AttributeProto, helper, numpy_helper
+
+    counter = 0
+
+    def _visit(graph: Any, renames: dict[str, str]) -> None:
+        nonlocal counter
+        kept = []
+        for node in graph.node:
+            for i, name in enumerate(node.input):
+                if name in renames:
+                    node.input[i] = renames[name]
+
+            value_attr = next(
+                (
+                    a for a in node.attribute
+                    if a.name == "value" and a.type == AttributeProto.TENSOR
+                ),
+                None,
+            )
+            if node.op_type == "Constant" and value_attr is not None and len(node.attribute) == 1:
+                array = numpy_helper.to_array(value_attr.t)
+                if array.nbytes >= WEIGHTS_ALIGNMENT:
+                    new_name = f"shared_const_{counter}"
+                    counter += 1
+                    renames[node.output[0]] = new_name
+                    model.graph.initializer.append(numpy_helper.from_array(array, new_name))
+                    continue
+
+            for attr in node.attribute:
+                if attr.type == AttributeProto.GRAPH:
+                    _visit(attr.g, dict(renames))
+                elif attr.type == AttributeProto.GRAPHS:
+                    for g in attr.graphs:
+                        _visit(g, dict(renames))
+            kept.append(node)
+
+        for output in graph.output:
+            if output.name in renames:
+                # 子图输出直接引用常量时保留一个 Identity
+                kept.append(helper.make_node("Identity", [renames[output.name]], [output.name]))
+
+        del graph.node[:]
+        graph.node.extend(kept)
+
+    _visit(model.graph, {})
+
+
+def prepare(name: str, source_path: str) -> None:
+    """把 ONNX 模型拆分为图文件 + 对齐的权重文件 + 清单"""
+    try:
+        import onnx
+        from onnx import TensorProto, numpy_helper
+    except ImportError:
+        raise RuntimeError("准备共享权重需要安装 onnx：pip install onnx") from None
+
+    SHARED_WEIGHTS_DIR.mkdir(parents=True, exist_ok=True)
+    model_path, weights_path, manifest_path = _paths(name)
+
+    model = onnx.load(source_path)
+    _hoist_constants(model)
+
+    initializers = []
+    with open(weights_path, "wb") as f:
+        for tensor in model.graph.initializer:
+            array = numpy_helper.to_array(tensor)
+            padding = -f.tell() % WEIGHTS_ALIGNMENT
+            f.write(b"\0" * padding)
+            offset = f.tell()
+            f.write(np.ascontiguousarray(array).tobytes())
+            initializers.append({
+                "name": tensor.name,
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+            })
+
+            # 图文件中的权重改为外部数据引用，运行时由 add_initializer 替换
+            tensor.ClearField("raw_data")
+            for field in (
+                "float_data", "int32_data", "int64_data",
+                "double_data", "uint64_data", "string_data",
+            ):
+                tensor.ClearField(field)
+            tensor.data_location = TensorProto.EXTERNAL
+            del tensor.external_data[:]
+            for key, value in (
+                ("location", weights_path.name),
+                ("offset", str(offset)),
+                ("length", str(array.nbytes)),
+            ):
+                entry = tensor.external_data.add()
+                entry.key, entry.value = key, value
+
+    onnx.save(model, str(model_path))
+    with open(manifest_path, "w") as f:
+        json.dump({"source": str(source_path), "initializers": initializers}, f)
+
+    print(
+        f"✓ {name}: {len(initializers)} 个权重, "
+        f"{weights_path.stat().st_size / 1024 / 1024:.1f}MB -> {weights_path}"
+    )
+
+
+def _source_models() -> dict[str, str]:
+    import importlib.resources
+    from livekit.plugins.turn_detector.base import _download_from_hf_hub
+    from livekit.plugins.turn_detector.models import HG_MODEL, MODEL_REVISIONS, ONNX_FILENAME
+
+    sources = {
+        SILERO_VAD: str(
+            importlib.resources.files("livekit.plugins.silero.resources") / "silero_vad.onnx"
+        ),
+    }
+    try:
+        sources[TURN_DETECTOR] = _download_from_hf_hub(
+            HG_MODEL,
+            ONNX_FILENAME,
+            subfolder="onnx",
+            revision=MODEL_REVISIONS["multilingual"],
+            local_files_only=True,
+        )
+    except Exception as e:
+        print(f"⚠️  未找到轮次检测模型，先执行 download-files: {e}")
+    return sources
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "prepare":
+        print("用法: python -m agent_runtime.shared_weights prepare")
+        sys.exit(1)
+    for model_name, source in _source_models().items():
+        prepare(model_name, source)
@@ -0,0 +1,185 @@
+"""回访用户画像 - 由历史对话增量生成用户摘要，新会话开始时注入 Assistant 指令
+
+- 预取：与 session.start() 并发执行一次查询（房间唯一索引关联画像唯一索引），
+  开场白开始后在后台把画像追加到 instructions（不等待查询），从孩子的第一轮回复起
+  Peppa 能记住孩子而不必把原始历史放进 prompt；
+- 更新：Job 关闭时读取该用户自上次汇总以来的新对话（ai_voice_user_profiles.last_conversation_id 之后），
+  与已有画像一起交给 LLM 合并为新的短摘要。某次会话未能更新时，下次会话关闭时一并补上。
+  水位按读取时的值条件推进，同一用户并发关闭的多个会话只有一个写入生效。
+"""
+import os
+import asyncio
+import logging
+from typing import Optional
+
+from livekit.agents import Agent, llm
+from livekit.plugins import openai
+
+from database import (
+    AsyncSessionLocal,
+    RoomRepository,
+    ConversationRepository,
+    UserProfileRepository,
+)
+from agent_runtime import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# 画像摘要的最大字符数（控制 prompt 长度）
+PROFILE_MAX_CHARS = int(os.getenv("USER_PROFILE_MAX_CHARS", "600"))
+# 生成画像使用的模型
+PROFILE_SUMMARY_MODEL = os.getenv("USER_PROFILE_SUMMARY_MODEL", "gpt-4.1-mini")
+# 单次汇总读取的新对话条数上限
+PROFILE_MAX_NEW_MESSAGES = 200
+# 单次交给 LLM 的对话文本上限（按整条截断，其余留到下次汇总）
+_MAX_TRANSCRIPT_CHARS = 8000
+
+_PROFILE_INSTRUCTIONS = """
+
+What you remember about this child from earlier chats (use it naturally, never recite it as a list):
+{summary}"""
+
+_SUMMARY_PROMPT = """You keep a short memory profile of a child who chats with Peppa Pig.
+Merge the current profile with the new conversation and return the updated profile only.
+Keep facts that help future chats: the child's name, age, family, pets, favourite things,
+ongoing stories or games, and topics the child did not like. Drop small talk.
+Write plain sentences in English, at most {max_chars} characters."""
+
+
+async def prefetch_profile(room_name: str) -> Optional[str]:
+    """读取房间用户的画像摘要（失败或没有画像时返回 None）
+
+    房间由服务端刚刚创建，走主库避免副本延迟。
+    """
+    try:
+        async with AsyncSessionLocal() as db:
+            profile = await UserProfileRepository.get_by_room(db, room_name)
+        return profile.summary if profile and profile.summary else None
+    except Exception as e:
+        logger.error(f"读取用户画像失败（不影响Agent）: room={room_name}, error={e}", exc_info=True)
+        return None
+
+
+def apply_profile(agent: Agent, prefetch: asyncio.Task) -> None:
+    """预取完成后在后台把画像追加到 Agent instructions（在开场白开始之后调用，不阻塞开场白）
+
+    开场白不带画像，画像从孩子的第一轮回复起生效。
+    """
+
+    async def _apply(summary: str) -> None:
+        try:
+            await agent.update_instructions(
+                agent.instructions + _PROFILE_INSTRUCTIONS.format(summary=summary)
+            )
+            logger.info(f"✓ 已注入回访用户画像（{len(summary)} 字符）")
+        except Exception as e:
+            logger.error(f"注入用户画像失败（不影响Agent）: {e}", exc_info=True)
+
+    def _on_prefetched(task: asyncio.Task) -> None:
+        if task.cancelled() or task.exception() or not task.result():
+            return
+        metrics.background_task(_apply(task.result()))
+
+    prefetch.add_done_callback(_on_prefetched)
+
+
+def create_summary_llm() -> llm.LLM:
+    return openai.LLM(model=PROFILE_SUMMARY_MODEL, api_key=os.getenv("OPENAI_API_KEY"))
+
+
+async def _summarize(current: str, transcript: str) -> str:
+    chat_ctx = llm.ChatContext.empty()
+    chat_ctx.add_message(role="system", content=_SUMMARY_PROMPT.format(max_chars=PROFILE_MAX_CHARS))
+    chat_ctx.add_message(
+        role="user",
+        content=f"Current profile:\n{current or '(none)'}\n\nNew conversation:\n{transcript}",
+    )
+
+    summary_llm = create_summary_llm()
+    stream = summary_llm.chat(chat_ctx=chat_ctx)
+    try:
+        parts = [
+            chunk.delta.content
+            async for chunk in stream
+            if chunk.delta and chunk.delta.content
+        ]
+    finally:
+        await stream.aclose()
+        await summary_llm.aclose()
+    return "".join(parts).strip()[:PROFILE_MAX_CHARS]
+
+
+def _format_transcript(conversations: list) -> tuple[str, int]:
+    """从最早的一条开始按整条拼接对话文本，不超过 _MAX_TRANSCRIPT_CHARS
+
+    Returns:
+        tuple[str, int]: (对话文本, 实际纳入的最后一条对话 ID)
+    """
+    lines: list[str] = []
+    size = 0
+    last_id = 0
+    for c in conversations:
+        line = f"{'Child' if c.role == 'user' else 'Peppa'}: {c.content.strip()}"
+        # 对话记录可能被多个钩子重复写入，去掉连续重复
+        if not lines or lines[-1] != line:
+            # 至少纳入一条，避免单条超长时水位永远无法推进
+            if lines and size + len(line) + 1 > _MAX_TRANSCRIPT_CHARS:
+                break
+            lines.append(line)
+            size += len(line) + 1
+        last_id = c.id
+    return "\n".join(lines)[:_MAX_TRANSCRIPT_CHARS], last_id
+
+
+async def update_profile(room_name: str) -> None:
+    """把该房间用户的新对话合并进画像（Job 关闭时调用）"""
+    try:
+        # 先等本会话的对话记录写完
+        await metrics.wait_background_tasks()
+
+        async with AsyncSessionLocal() as db:
+            room = await RoomRepository.get_by_name(db, room_name)
+            if not room:
+                return
+            profile = await UserProfileRepository.get_by_user(db, room.user_id)
+            conversations = await ConversationRepository.get_by_user_after(
+                db,
+                room.user_id,
+                after_id=profile.last_conversation_id if profile else 0,
+                limit=PROFILE_MAX_NEW_MESSAGES,
+            )
+        if not conversations:
+            return
+
+        # 水位只推进到实际交给 LLM 的最后一条，未纳入的对话留到下次汇总
+        transcript, last_conversation_id = _format_transcript(conversations)
+        summary = await _summarize(profile.summary if profile else "", transcript)
+        if not summary:
+            return
+
+        # 条件写入：同一用户的其他会话已先推进水位时放弃本次结果，避免重复汇总和重复计数
+        async with AsyncSessionLocal() as db:
+            try:
+                async with metrics.db_write("UserProfileRepository.advance"):
+                    advanced = await UserProfileRepository.advance(
+                        db,
+                        room.user_id,
+                        summary,
+                        last_conversation_id,
+                        expected_last_id=profile.last_conversation_id if profile else None,
+                    )
+                    await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        if not advanced:
+            logger.info(f"用户 {room.user_id} 的画像已由其他会话更新，跳过本次写入")
+            return
+        logger.info(
+            f"✓ 已更新用户 {room.user_id} 的画像: 汇总 "
+            f"{sum(1 for c in conversations if c.id <= last_conversation_id)} 条新对话, "
+            f"{len(summary)} 字符"
+        )
+    except Exception as e:
+        logger.error(f"更新用户画像失败（不影响Agent）: room={room_name}, error={e}", exc_info=True)
@@ -0,0 +1,103 @@
+"""轮次检测吞吐基准 - 经由真实的 Worker 推理进程
+
+与 Worker 相同的方式启动推理进程（InferenceProcExecutor，参数与 AgentServer 一致），
+N 个并发客户端模拟各 Job 进程，持续发送轮次检测请求，对比：
+
+- 插件原生 runner（_EUORunnerMultilingual）：推理进程逐个处理请求；
+- BatchedEOURunner：推理进程并发分发请求，同时等待的请求合并为一批。
+
+输出每秒完成的请求数、每核吞吐（按当前进程可用的 CPU 数）和请求延迟 p50 / p95。
+
+用法（先执行 python -m agent_runtime.shared_weights prepare）:
+    taskset -c 0-3 python -m benchmarks.eou_throughput --clients 40 --seconds 10
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import multiprocessing as mp
+
+from livekit.agents.ipc.inference_proc_executor import InferenceProcExecutor
+from livekit.plugins.turn_detector.multilingual import _EUORunnerMultilingual
+
+from agent_runtime.batched_inference import BatchedEOURunner
+
+_CHAT_CTX = [
+    {"role": "assistant", "content": "Hello! I'm Peppa Pig! What's your favourite colour?"},
+    {"role": "user", "content": "I like blue because it's the colour of the sky and"},
+]
+
+
+def _percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def _measure(runner: type, clients: int, seconds: float) -> tuple[int, list[float]]:
+    executor = InferenceProcExecutor(
+        runners={runner.INFERENCE_METHOD: runner},
+        initialize_timeout=5 * 60,
+        close_timeout=5,
+        memory_warn_mb=2000,
+        memory_limit_mb=0,
+        ping_interval=5,
+        ping_timeout=60,
+        high_ping_threshold=2.5,
+        mp_ctx=mp.get_context("spawn"),
+        loop=asyncio.get_running_loop(),
+        http_proxy=None,
+    )
+    await executor.start()
+    await executor.initialize()
+
+    latencies: list[float] = []
+
+    async def _client(idx: int, deadline: float) -> None:
+        chat_ctx = [dict(m) for m in _CHAT_CTX]
+        chat_ctx[-1]["content"] += f" the sea {idx}"
+        data = json.dumps({"chat_ctx": chat_ctx}).encode()
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await executor.do_inference(runner.INFERENCE_METHOD, data)
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        # 预热
+        await _client(0, time.perf_counter() + 1.0)
+        latencies.clear()
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(_client(i, deadline) for i in range(clients)))
+    finally:
+        await executor.aclose()
+    return len(latencies), latencies
+
+
+async def _main(clients: int, seconds: float) -> None:
+    cores = len(os.sched_getaffinity(0))
+    print(f"clients={clients}, seconds={seconds}, cores={cores}")
+    baseline = None
+    for name, runner in (
+        ("插件原生 runner（逐个处理）", _EUORunnerMultilingual),
+        ("BatchedEOURunner（并发分发 + 批处理）", BatchedEOURunner),
+    ):
+        count, latencies = await _measure(runner, clients, seconds)
+        rate = count / seconds
+        baseline = baseline or max(rate, 1e-9)
+        print(
+            f"{name}: {rate:,.0f} 次/秒, {rate / cores:,.0f} 次/秒/核（{rate / baseline:.2f}x）, "
+            f"p50 {_percentile(latencies, 0.5) * 1000:.1f}ms, "
+            f"p95 {_percentile(latencies, 0.95) * 1000:.1f}ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="轮次检测推理进程吞吐基准")
+    parser.add_argument("--clients", type=int, default=40)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+    asyncio.run(_main(args.clients, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""VAD 推理吞吐基准（每核）
+
+N 个并发流，每个流持续送入 32ms 音频窗口，通过 VAD.stream() 所用的推理模型执行，对比：
+
+- 进程执行器（默认，实际部署方式）：一个 Job 一个进程，每个进程一个流，
+  prewarm 以 BatchedVAD.load(batched=False) 加载，逐流直接推理；
+- 线程执行器：所有流在同一进程内共享一个 BatchedVAD.load()，经批处理器合并推理。
+
+输出每秒推理次数、每核吞吐（按当前进程可用的 CPU 数）和每核可承载的实时流数
+（每个流每秒 31.25 次推理）。
+
+用法（用 taskset 限定核数）:
+    taskset -c 0 python -m benchmarks.inference_throughput --streams 50 --seconds 5
+"""
+import os
+import time
+import argparse
+import threading
+import multiprocessing as mp
+
+import numpy as np
+from livekit.plugins.silero import onnx_model
+
+from agent_runtime.batched_inference import BatchedOnnxModel, BatchedVAD
+
+SAMPLE_RATE = 16000
+# 每个实时流每秒的推理次数（32ms 一帧）
+FRAMES_PER_SECOND = 1000 / 32
+
+
+def _stream_model(vad: BatchedVAD) -> onnx_model.OnnxModel:
+    """与 BatchedVAD.stream() 为每个流创建的推理模型相同"""
+    model_cls = BatchedOnnxModel if vad._batched else onnx_model.OnnxModel
+    return model_cls(onnx_session=vad._onnx_session, sample_rate=SAMPLE_RATE)
+
+
+def _run_stream(model: onnx_model.OnnxModel, seed: int, deadline: float) -> int:
+    rng = np.random.default_rng(seed)
+    x = (rng.standard_normal(model.window_size_samples) * 0.1).astype(np.float32)
+    count = 0
+    while time.perf_counter() < deadline:
+        model(x)
+        count += 1
+    return count
+
+
+def _job_process(seed: int, start: float, seconds: float, ready, results) -> None:
+    """模拟进程执行器下的一个 Job 进程"""
+    model = _stream_model(BatchedVAD.load(batched=False, sample_rate=SAMPLE_RATE))
+    ready.release()
+    time.sleep(max(0.0, start - time.time()))
+    results.put(_run_stream(model, seed, time.perf_counter() + seconds))
+
+
+def _measure_process_executor(streams: int, seconds: float) -> int:
+    ctx = mp.get_context("spawn")
+    ready = ctx.Semaphore(0)
+    results = ctx.Queue()
+    # 模型加载完成后同时开始
+    start = time.time() + 5 + streams * 0.2
+    procs = [
+        ctx.Process(target=_job_process, args=(i, start, seconds, ready, results))
+        for i in range(streams)
+    ]
+    for p in procs:
+        p.start()
+    for _ in procs:
+        ready.acquire()
+    total = sum(results.get() for _ in procs)
+    for p in procs:
+        p.join()
+    return total
+
+
+def _measure_thread_executor(streams: int, seconds: float) -> int:
+    vad = BatchedVAD.load(batched=True, sample_rate=SAMPLE_RATE)
+    models = [_stream_model(vad) for _ in range(streams)]
+    counts = [0] * streams
+    deadline = time.perf_counter() + seconds
+
+    def _worker(idx: int) -> None:
+        counts[idx] = _run_stream(models[idx], idx, deadline)
+
+    threads = [threading.Thread(target=_worker, args=(i,)) for i in range(streams)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(counts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="VAD 推理吞吐基准（每核）")
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    cores = len(os.sched_getaffinity(0))
+    print(f"streams={args.streams}, seconds={args.seconds}, cores={cores}")
+    baseline = None
+    for name, measure in (
+        ("进程执行器，逐流推理（实际部署）", _measure_process_executor),
+        ("线程执行器，共享 BatchedVAD 批处理", _measure_thread_executor),
+    ):
+        per_core = measure(args.streams, args.seconds) / args.seconds / cores
+        baseline = baseline or max(per_core, 1e-9)
+        print(
+            f"{name}: {per_core:,.0f} 次/秒/核（{per_core / baseline:.2f}x），"
+            f"每核约 {per_core / FRAMES_PER_SECOND:,.0f} 个实时流"
+        )
+
+
+if __name__ == "__main__":
+    main()
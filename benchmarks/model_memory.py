@@ -0,0 +1,115 @@
+"""模型内存基准 - 对比每个 Job 进程独立加载与共享内存映射加载的 RSS / PSS
+
+启动 N 个子进程模拟并发 Job，每个进程加载模型并执行一次推理后保持存活，
+读取各进程 /proc/<pid>/smaps_rollup 中的 Rss 与 Pss（Pss 按共享进程数分摊共享页）。
+
+用法（先执行 python -m agent_runtime.shared_weights prepare）:
+    python -m benchmarks.model_memory --jobs 8
+"""
+import time
+import argparse
+import multiprocessing as mp
+
+import numpy as np
+
+from agent_runtime import shared_weights
+
+
+def _read_memory_kb(pid: int) -> dict[str, int]:
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                memory[parts[0].rstrip(":")] = int(parts[1])
+    return memory
+
+
+def _load_vad(shared: bool):
+    from livekit.plugins.silero import onnx_model
+
+    if shared:
+        session = shared_weights.load_session(shared_weights.SILERO_VAD)
+    else:
+        session = onnx_model.new_inference_session(force_cpu=True)
+    session.run(None, {
+        "input": np.zeros((1, 576), dtype=np.float32),
+        "state": np.zeros((2, 1, 128), dtype=np.float32),
+        "sr": np.array(16000, dtype=np.int64),
+    })
+    return session
+
+
+def _load_turn_detector(shared: bool):
+    import onnxruntime
+    from livekit.plugins.turn_detector.base import _download_from_hf_hub
+    from livekit.plugins.turn_detector.models import HG_MODEL, MODEL_REVISIONS, ONNX_FILENAME
+
+    if shared:
+        session = shared_weights.load_session(shared_weights.TURN_DETECTOR)
+    else:
+        path = _download_from_hf_hub(
+            HG_MODEL,
+            ONNX_FILENAME,
+            subfolder="onnx",
+            revision=MODEL_REVISIONS["multilingual"],
+            local_files_only=True,
+        )
+        session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+    session.run(None, {"input_ids": np.ones((1, 16), dtype=np.int64)})
+    return session
+
+
+_LOADERS = {
+    shared_weights.SILERO_VAD: _load_vad,
+    shared_weights.TURN_DETECTOR: _load_turn_detector,
+}
+
+
+def _job(model: str, shared: bool, ready, stop) -> None:
+    session = _LOADERS[model](shared)
+    ready.release()
+    stop.wait()
+    del session
+
+
+def _measure(model: str, shared: bool, jobs: int) -> tuple[float, float]:
+    ctx = mp.get_context("spawn")
+    ready = ctx.Semaphore(0)
+    stop = ctx.Event()
+    procs = [ctx.Process(target=_job, args=(model, shared, ready, stop)) for _ in range(jobs)]
+    for p in procs:
+        p.start()
+    for _ in procs:
+        ready.acquire()
+    time.sleep(0.5)
+
+    samples = [_read_memory_kb(p.pid) for p in procs]
+    stop.set()
+    for p in procs:
+        p.join()
+
+    rss = sum(s["Rss"] for s in samples) / jobs / 1024
+    pss = sum(s["Pss"] for s in samples) / jobs / 1024
+    return rss, pss
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="模型内存基准")
+    parser.add_argument("--jobs", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"jobs={args.jobs}（每个 Job 进程的平均值，单位 MB）")
+    print(f"{'model':<28}{'mode':<10}{'RSS':>10}{'PSS':>10}")
+    for model in _LOADERS:
+        if not shared_weights.is_prepared(model):
+            print(f"{model:<28}未准备共享权重，跳过")
+            continue
+        for shared in (False, True):
+            rss, pss = _measure(model, shared, args.jobs)
+            mode = "shared" if shared else "private"
+            print(f"{model:<28}{mode:<10}{rss:>10.1f}{pss:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
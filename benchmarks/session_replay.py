@@ -0,0 +1,688 @@
+"""会话回放 - 用录制的会话时间线驱动入口函数与 Assistant，检测轮次延迟与数据库写入回归
+
+录制文件由 agent_runtime.recorder 生成（设置 SESSION_RECORDINGS_DIR）。回放时：
+- 入口函数 peppa_agent 原样执行，房间 / JobContext 替换为内存实现，不连接 LiveKit；
+- create_session() 替换为桩 provider：LLM 按录制顺序返回录制的回复并重现首 token 耗时与生成时长，
+  TTS 重现录制的首字节耗时与每字符音频时长，音频输出按实时速度模拟播放；
+- 数据库替换为内存桩，返回录制房间的行并统计写入语句与提交次数；
+- 参与者进出按录制的时间间隔重放，用户轮次在上一轮播放结束后按录制的间隔注入，
+  录制中用户打断 Agent 的轮次在注入前先打断当前发言。
+
+轮次延迟 = 注入用户输入到 Agent 首帧音频开始播放（不含 STT / 轮次检测，回放中没有音频输入）。
+全程不访问网络。
+
+用法:
+    python -m benchmarks.session_replay recordings/*.json --output baseline.json
+    python -m benchmarks.session_replay recordings/*.json --baseline baseline.json
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import asyncio
+import inspect
+import argparse
+import importlib
+import statistics
+from collections import Counter
+from contextlib import ExitStack
+from dataclasses import dataclass
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Optional
+from unittest import mock
+
+# 回放不录制、不导出指标、不播放填充音（填充音走单独的轨道，不影响轮次延迟）
+# 必须在导入 peppa_agent 之前设置，load_dotenv 不覆盖已有变量
+os.environ["SESSION_RECORDINGS_DIR"] = ""
+os.environ["PROMETHEUS_PORT"] = ""
+os.environ["FILLER_AUDIO_DIR"] = ""
+
+from livekit import rtc
+from livekit.agents import (
+    DEFAULT_API_CONNECT_OPTIONS,
+    AgentSession,
+    APIConnectOptions,
+    NOT_GIVEN,
+    llm,
+    tts,
+    utils,
+)
+from livekit.agents.voice import io
+
+from agent_runtime import metrics
+from agent_runtime.admission import SESSION_MODE_ATTRIBUTE
+from database.models import Room
+
+
+# 使用 AsyncSessionLocal 的模块，回放时替换为内存数据库桩
+DB_MODULES = (
+    "peppa_agent",
+    "agent_runtime.session_guard",
+    "agent_runtime.checkpoint",
+    "agent_runtime.user_profile",
+)
+
+TTS_SAMPLE_RATE = 24000
+# 录制中缺少 LLM / TTS 耗时时使用的默认值
+DEFAULT_LLM_TIMING = {"ttft": 0.5, "duration": 1.0}
+DEFAULT_TTS_TTFB = 0.3
+DEFAULT_SECONDS_PER_CHAR = 0.07
+
+
+# ========== 录制时间线 ==========
+
+@dataclass
+class ReplayStep:
+    kind: str  # join / leave / user
+    delay: float
+    identity: str = ""
+    text: str = ""
+    barge_in: bool = False
+
+
+class Timeline:
+    """把录制事件整理为回放步骤与 provider 耗时"""
+
+    def __init__(self, recording: dict):
+        self.room_name: str = recording["room_name"]
+        self.metadata: str = recording.get("metadata", "")
+        events: list[dict] = recording["events"]
+
+        self.duration = events[-1]["t"] if events else 0.0
+        self.initial_participants = [
+            e["identity"] for e in events
+            if e["type"] == "participant_connected" and e.get("existing")
+        ]
+        self.responses = [
+            e["text"] for e in events
+            if e["type"] == "conversation_item" and e["role"] == "assistant"
+        ]
+        self.llm_timings = [
+            {"ttft": e["ttft"], "duration": e["duration"]}
+            for e in events
+            if e["type"] == "llm" and not e["cancelled"] and e["ttft"] >= 0
+        ]
+
+        tts_events = [e for e in events if e["type"] == "tts" and not e["cancelled"]]
+        ttfbs = [e["ttfb"] for e in tts_events if e["ttfb"] >= 0]
+        self.tts_ttfb = statistics.median(ttfbs) if ttfbs else DEFAULT_TTS_TTFB
+        characters = sum(e["characters"] for e in tts_events)
+        self.seconds_per_char = (
+            sum(e["audio_duration"] for e in tts_events) / characters
+            if characters else DEFAULT_SECONDS_PER_CHAR
+        )
+
+        self.steps = self._build_steps(events)
+
+    @staticmethod
+    def _build_steps(events: list[dict]) -> list[ReplayStep]:
+        steps = []
+        prev_t = 0.0
+        agent_state = "initializing"
+        listening_at: Optional[float] = None
+        for e in events:
+            if e["type"] == "agent_state":
+                agent_state = e["state"]
+                if agent_state == "listening":
+                    listening_at = e["t"]
+            elif e["type"] == "participant_connected" and not e.get("existing"):
+                steps.append(ReplayStep("join", e["t"] - prev_t, identity=e["identity"]))
+                prev_t = e["t"]
+            elif e["type"] == "participant_disconnected":
+                steps.append(ReplayStep("leave", e["t"] - prev_t, identity=e["identity"]))
+                prev_t = e["t"]
+            elif e["type"] == "conversation_item" and e["role"] == "user":
+                barge_in = agent_state in ("thinking", "speaking")
+                # 非打断轮次从 Agent 回到 listening 开始计算间隔（回放中等待上一轮播放结束）
+                anchor = prev_t if barge_in or listening_at is None else max(prev_t, listening_at)
+                steps.append(ReplayStep(
+                    "user", max(0.0, e["t"] - anchor), text=e["text"], barge_in=barge_in,
+                ))
+                prev_t = e["t"]
+        return steps
+
+
+# ========== 桩 provider ==========
+
+class ReplayLLMStream(llm.LLMStream):
+    def __init__(self, replay_llm: "ReplayLLM", *, text: str, timing: dict, **kwargs: Any):
+        super().__init__(replay_llm, **kwargs)
+        self._text = text
+        self._timing = timing
+
+    async def _run(self) -> None:
+        request_id = utils.shortuuid("replay_")
+        ttft = self._timing["ttft"]
+        await asyncio.sleep(ttft)
+        pieces = re.findall(r"\S+\s*", self._text) or [self._text]
+        interval = max(0.0, self._timing["duration"] - ttft) / len(pieces)
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(interval)
+            self._event_ch.send_nowait(
+                llm.ChatChunk(
+                    id=request_id,
+                    delta=llm.ChoiceDelta(role="assistant", content=piece),
+                )
+            )
+
+
+class ReplayLLM(llm.LLM):
+    """按录制顺序返回 Agent 回复，重现首 token 耗时与生成时长"""
+
+    def __init__(self, responses: list[str], timings: list[dict]):
+        super().__init__()
+        self._responses = responses
+        self._timings = timings
+        self.calls = 0
+
+    def chat(
+        self,
+        *,
+        chat_ctx: llm.ChatContext,
+        tools: Optional[list] = None,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+        **kwargs: Any,
+    ) -> ReplayLLMStream:
+        idx = self.calls
+        self.calls += 1
+        # 回复次数超出录制时重复最后一条（调用次数本身会计入报告）
+        text = self._responses[min(idx, len(self._responses) - 1)] if self._responses else ""
+        timing = (
+            self._timings[min(idx, len(self._timings) - 1)]
+            if self._timings else DEFAULT_LLM_TIMING
+        )
+        return ReplayLLMStream(
+            self,
+            text=text,
+            timing=timing,
+            chat_ctx=chat_ctx,
+            tools=tools or [],
+            conn_options=conn_options,
+        )
+
+
+class ReplayChunkedStream(tts.ChunkedStream):
+    async def _run(self, output_emitter: tts.AudioEmitter) -> None:
+        replay_tts: ReplayTTS = self._tts
+        output_emitter.initialize(
+            request_id=utils.shortuuid("replay_"),
+            sample_rate=TTS_SAMPLE_RATE,
+            num_channels=1,
+            mime_type="audio/pcm",
+        )
+        await asyncio.sleep(replay_tts.ttfb)
+        samples = int(len(self._input_text) * replay_tts.seconds_per_char * TTS_SAMPLE_RATE)
+        output_emitter.push(bytes(samples * 2))
+        output_emitter.flush()
+
+
+class ReplayTTS(tts.TTS):
+    """按录制的首字节耗时（中位数）与每字符音频时长合成静音"""
+
+    def __init__(self, ttfb: float, seconds_per_char: float):
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=False),
+            sample_rate=TTS_SAMPLE_RATE,
+            num_channels=1,
+        )
+        self.ttfb = ttfb
+        self.seconds_per_char = seconds_per_char
+        self.calls = 0
+
+    def synthesize(
+        self, text: str, *, conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS
+    ) -> ReplayChunkedStream:
+        self.calls += 1
+        return ReplayChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+
+class ReplayAudioOutput(io.AudioOutput):
+    """按实时速度模拟播放：每段音频在推送时长结束后（或被打断时）上报播放完成"""
+
+    def __init__(self) -> None:
+        super().__init__(
+            label="Replay",
+            capabilities=io.AudioOutputCapabilities(pause=False),
+        )
+        self._pushed_duration = 0.0
+        self._playback_started = 0.0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._interrupted = asyncio.Event()
+
+    async def capture_frame(self, frame: rtc.AudioFrame) -> None:
+        await super().capture_frame(frame)
+        if self._flush_task and not self._flush_task.done():
+            await self._flush_task
+        if not self._pushed_duration:
+            self._playback_started = time.monotonic()
+            self.on_playback_started(created_at=time.time())
+        self._pushed_duration += frame.duration
+
+    def flush(self) -> None:
+        super().flush()
+        if self._pushed_duration:
+            self._flush_task = asyncio.create_task(self._wait_for_playout())
+
+    def clear_buffer(self) -> None:
+        if self._pushed_duration:
+            self._interrupted.set()
+
+    async def _wait_for_playout(self) -> None:
+        remaining = self._playback_started + self._pushed_duration - time.monotonic()
+        try:
+            await asyncio.wait_for(self._interrupted.wait(), max(0.0, remaining))
+            interrupted = True
+        except asyncio.TimeoutError:
+            interrupted = False
+
+        played = time.monotonic() - self._playback_started
+        self.on_playback_finished(
+            playback_position=min(played, self._pushed_duration) if interrupted else self._pushed_duration,
+            interrupted=interrupted,
+        )
+        self._pushed_duration = 0.0
+        self._interrupted.clear()
+
+
+class ReplayAgentSession(AgentSession):
+    """不连接房间，音频输出使用模拟播放"""
+
+    def __init__(self, audio_output: ReplayAudioOutput, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._replay_audio_output = audio_output
+
+    async def start(self, agent: Any, *, room: Any = NOT_GIVEN, **kwargs: Any) -> Any:
+        self.output.audio = self._replay_audio_output
+        return await super().start(agent, **kwargs)
+
+
+# ========== 房间 / JobContext / 数据库 ==========
+
+class ReplayRoom(rtc.EventEmitter):
+    def __init__(self, name: str, metadata: str):
+        super().__init__()
+        self.name = name
+        self.metadata = metadata
+        self.remote_participants: dict[str, Any] = {}
+
+    def isconnected(self) -> bool:
+        return True
+
+    def connect_participant(self, identity: str, emit: bool = True) -> None:
+        participant = SimpleNamespace(identity=identity, attributes={})
+        self.remote_participants[identity] = participant
+        if emit:
+            self.emit("participant_connected", participant)
+
+    def disconnect_participant(self, identity: str) -> None:
+        participant = self.remote_participants.pop(identity, None)
+        if participant:
+            self.emit("participant_disconnected", participant)
+
+
+class ReplayJobContext:
+    def __init__(self, room: ReplayRoom, session_mode: str = "normal"):
+        self.room = room
+        self._session_mode = session_mode
+        self.job = SimpleNamespace(id=utils.shortuuid("replay_"))
+        # 回放不使用 VAD（create_session 已替换）
+        self.proc = SimpleNamespace(userdata={"vad": None})
+        self.shutdown_reason: Optional[str] = None
+        self._shutdown_callbacks: list = []
+        self._shutdown_task: Optional[asyncio.Task] = None
+
+    def token_claims(self) -> SimpleNamespace:
+        # 准入控制分配的会话模式
+        return SimpleNamespace(attributes={SESSION_MODE_ATTRIBUTE: self._session_mode})
+
+    def add_shutdown_callback(self, callback: Any) -> None:
+        self._shutdown_callbacks.append(callback)
+
+    def shutdown(self, reason: str = "") -> None:
+        if self._shutdown_task:
+            return
+        self.shutdown_reason = reason
+        self._shutdown_task = asyncio.create_task(self._run_shutdown_callbacks(reason))
+
+    async def _run_shutdown_callbacks(self, reason: str) -> None:
+        for callback in self._shutdown_callbacks:
+            if callback.__code__.co_argcount >= (2 if inspect.ismethod(callback) else 1):
+                await callback(reason)
+            else:
+                await callback()
+
+    async def wait_shutdown(self) -> None:
+        if self._shutdown_task:
+            await self._shutdown_task
+
+
+class _ReplayResult:
+    def __init__(self, rows: list, rowcount: int = 0):
+        self._rows = rows
+        self.rowcount = rowcount
+
+    def scalar_one_or_none(self) -> Any:
+        return self._rows[0] if self._rows else None
+
+    def scalars(self) -> "_ReplayResult":
+        return self
+
+    def all(self) -> list:
+        return self._rows
+
+
+class _ReplayDBSession:
+    def __init__(self, db: "ReplayDatabase"):
+        self._db = db
+        self._pending: list[tuple[str, Any]] = []
+
+    async def __aenter__(self) -> "_ReplayDBSession":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> bool:
+        return False
+
+    async def execute(self, statement: Any, *args: Any, **kwargs: Any) -> _ReplayResult:
+        await asyncio.sleep(self._db.latency)
+        if statement.is_select:
+            tables = [getattr(f, "name", "") for f in statement.get_final_froms()]
+            self._db.reads[f"select {','.join(tables)}"] += 1
+            return _ReplayResult([self._db.room] if tables == [Room.__tablename__] else [])
+
+        operation = "update" if statement.is_update else "insert" if statement.is_insert else "delete"
+        self._pending.append((f"{operation} {statement.table.name}", statement))
+        return _ReplayResult([], rowcount=1)
+
+    def add(self, instance: Any) -> None:
+        self._pending.append((f"insert {instance.__tablename__}", None))
+
+    async def flush(self) -> None:
+        await asyncio.sleep(self._db.latency)
+
+    async def refresh(self, instance: Any) -> None:
+        pass
+
+    async def commit(self) -> None:
+        await asyncio.sleep(self._db.latency)
+        self._db.commits += 1
+        if self._pending:
+            self._db.write_commits += 1
+        for name, statement in self._pending:
+            self._db.writes[name] += 1
+            if statement is not None and statement.is_update and statement.table.name == Room.__tablename__:
+                self._db.apply_room_update(statement)
+        self._pending.clear()
+
+    async def rollback(self) -> None:
+        self._pending.clear()
+
+
+class ReplayDatabase:
+    """内存数据库桩：查询房间时返回录制房间的行，统计读写语句与提交次数"""
+
+    def __init__(self, room: Room, latency: float):
+        self.room = room
+        self.latency = latency
+        self.reads: Counter = Counter()
+        self.writes: Counter = Counter()
+        self.commits = 0
+        self.write_commits = 0
+
+    def __call__(self) -> _ReplayDBSession:
+        return _ReplayDBSession(self)
+
+    def apply_room_update(self, statement: Any) -> None:
+        for key, value in statement.compile().params.items():
+            if key in Room.__table__.c:
+                setattr(self.room, key, value)
+
+
+# ========== 回放 ==========
+
+def _percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(p * len(ordered)) - 1)]
+
+
+def _latency_summary(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50": round(_percentile(values, 0.5), 4),
+        "p95": round(_percentile(values, 0.95), 4),
+        "max": round(max(values), 4) if values else 0.0,
+    }
+
+
+class SessionReplay:
+    def __init__(
+        self,
+        recording: dict,
+        speed: float = 1.0,
+        db_latency: float = 0.002,
+        session_mode: str = "normal",
+    ):
+        self._timeline = Timeline(recording)
+        self._speed = speed
+        self._db_latency = db_latency
+        self._session_mode = session_mode
+
+        self._session: Optional[ReplayAgentSession] = None
+        self._llm: Optional[ReplayLLM] = None
+        self._tts: Optional[ReplayTTS] = None
+        self._speeches: list = []
+        self._turn_started: Optional[float] = None
+        self._turn_latencies: list[float] = []
+        self._startup_latency: Optional[float] = None
+        self._entry_started = 0.0
+
+    def _create_session(self, vad: Any = None, profile: Any = None) -> ReplayAgentSession:
+        timeline = self._timeline
+        self._llm = ReplayLLM(timeline.responses, timeline.llm_timings)
+        self._tts = ReplayTTS(timeline.tts_ttfb, timeline.seconds_per_char)
+        audio_output = ReplayAudioOutput()
+        audio_output.on("playback_started", self._on_playback_started)
+
+        session = ReplayAgentSession(audio_output, llm=self._llm, tts=self._tts)
+        session.on("speech_created", lambda ev: self._speeches.append(ev.speech_handle))
+        self._session = session
+        return session
+
+    def _on_playback_started(self, _ev: Any) -> None:
+        now = time.monotonic()
+        if self._startup_latency is None:
+            self._startup_latency = now - self._entry_started
+        if self._turn_started is not None:
+            self._turn_latencies.append(now - self._turn_started)
+            self._turn_started = None
+
+    async def _wait_idle(self) -> None:
+        while True:
+            pending = [s for s in self._speeches if not s.done()]
+            if not pending:
+                return
+            await asyncio.gather(*(s.wait_for_playout() for s in pending), return_exceptions=True)
+
+    async def _user_turn(self, step: ReplayStep) -> None:
+        session = self._session
+        if step.barge_in:
+            session.interrupt()
+        session._update_user_state("speaking")
+        session._update_user_state("listening")
+        session.emit(
+            "user_input_transcribed",
+            SimpleNamespace(type="user_input_transcribed", transcript=step.text, is_final=True),
+        )
+        self._turn_started = time.monotonic()
+        session.generate_reply(user_input=step.text)
+
+    async def run(self) -> dict:
+        app = importlib.import_module("peppa_agent")
+        timeline = self._timeline
+
+        user_id = timeline.initial_participants[0] if timeline.initial_participants else "replay-user"
+        db = ReplayDatabase(
+            Room(
+                room_name=timeline.room_name,
+                agent_name="peppa",
+                user_id=user_id,
+                timeout_minutes=math.ceil(timeline.duration / 60) + 1,
+                status="active",
+                created_at=datetime.now(),
+                chat_duration=0,
+            ),
+            self._db_latency,
+        )
+        room = ReplayRoom(timeline.room_name, timeline.metadata)
+        for identity in timeline.initial_participants:
+            room.connect_participant(identity, emit=False)
+        ctx = ReplayJobContext(room, self._session_mode)
+
+        with ExitStack() as stack:
+            stack.enter_context(mock.patch.object(app, "create_session", self._create_session))
+            for module_name in DB_MODULES:
+                module = importlib.import_module(module_name)
+                stack.enter_context(mock.patch.object(module, "AsyncSessionLocal", db))
+
+            self._entry_started = time.monotonic()
+            await app.peppa_agent(ctx)
+            if self._session is None:
+                raise RuntimeError(f"入口函数未启动会话（房间 {timeline.room_name} 的 metadata 不匹配？）")
+
+            for step in timeline.steps:
+                if ctx.shutdown_reason:
+                    break
+                if step.kind == "user" and not step.barge_in:
+                    await self._wait_idle()
+                await asyncio.sleep(step.delay / self._speed)
+                if step.kind == "join":
+                    room.connect_participant(step.identity)
+                elif step.kind == "leave":
+                    room.disconnect_participant(step.identity)
+                else:
+                    await self._user_turn(step)
+
+            await self._wait_idle()
+            if not ctx.shutdown_reason:
+                ctx.shutdown("replay_finished")
+            await ctx.wait_shutdown()
+            await self._session.aclose()
+
+            # 等待后台数据库写入完成，保证写入统计完整
+            await metrics.wait_background_tasks()
+
+        user_turns = sum(1 for s in timeline.steps if s.kind == "user")
+        return {
+            "room_name": timeline.room_name,
+            "shutdown_reason": ctx.shutdown_reason,
+            "user_turns": user_turns,
+            "startup_latency": round(self._startup_latency or 0.0, 4),
+            "turn_latency": _latency_summary(self._turn_latencies),
+            "turn_latencies": [round(v, 4) for v in self._turn_latencies],
+            "llm_calls": self._llm.calls,
+            "tts_calls": self._tts.calls,
+            "db": {
+                "commits": db.commits,
+                "write_commits": db.write_commits,
+                "writes": dict(db.writes),
+                "reads": dict(db.reads),
+            },
+        }
+
+
+def summarize(sessions: list[dict]) -> dict:
+    latencies = [v for s in sessions for v in s["turn_latencies"]]
+    user_turns = sum(s["user_turns"] for s in sessions)
+    write_commits = sum(s["db"]["write_commits"] for s in sessions)
+    return {
+        "sessions": len(sessions),
+        "user_turns": user_turns,
+        "startup_latency_p50": round(_percentile([s["startup_latency"] for s in sessions], 0.5), 4),
+        "turn_latency_p50": round(_percentile(latencies, 0.5), 4),
+        "turn_latency_p95": round(_percentile(latencies, 0.95), 4),
+        "llm_calls": sum(s["llm_calls"] for s in sessions),
+        "db_write_commits": write_commits,
+        "db_commits": sum(s["db"]["commits"] for s in sessions),
+    }
+
+
+# 延迟类指标按相对容差 + 绝对余量比较，计数类指标不允许增加
+_LATENCY_CHECKS = ("startup_latency_p50", "turn_latency_p50", "turn_latency_p95")
+_COUNT_CHECKS = ("llm_calls", "db_write_commits", "db_commits")
+
+
+def compare(summary: dict, baseline: dict, tolerance: float, slack: float) -> list[str]:
+    regressions = []
+    for key in _LATENCY_CHECKS:
+        limit = baseline[key] * (1 + tolerance) + slack
+        if summary[key] > limit:
+            regressions.append(f"{key}: {summary[key]:.3f}s > {limit:.3f}s（基线 {baseline[key]:.3f}s）")
+    for key in _COUNT_CHECKS:
+        if summary[key] > baseline[key]:
+            regressions.append(f"{key}: {summary[key]} > 基线 {baseline[key]}")
+    return regressions
+
+
+async def _replay_all(
+    paths: list[str], speed: float, db_latency: float, session_mode: str
+) -> list[dict]:
+    sessions = []
+    for path in paths:
+        with open(path) as f:
+            recording = json.load(f)
+        report = await SessionReplay(recording, speed, db_latency, session_mode).run()
+        report["recording"] = os.path.basename(path)
+        print(
+            f"{report['recording']}: turns={report['user_turns']} "
+            f"startup={report['startup_latency']:.3f}s "
+            f"turn_p50={report['turn_latency']['p50']:.3f}s "
+            f"turn_p95={report['turn_latency']['p95']:.3f}s "
+            f"db_write_commits={report['db']['write_commits']}"
+        )
+        sessions.append(report)
+    return sessions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="会话回放回归测试")
+    parser.add_argument("recordings", nargs="+", help="录制文件（agent_runtime.recorder 生成）")
+    parser.add_argument("--speed", type=float, default=1.0, help="用户间隔的加速倍数（不影响 provider 耗时）")
+    parser.add_argument("--db-latency-ms", type=float, default=2.0, help="内存数据库每次操作的模拟耗时")
+    parser.add_argument("--output", help="写出回放报告（可作为后续比较的基线）")
+    parser.add_argument("--baseline", help="基线报告，出现回归时退出码为 1")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="延迟相对容差")
+    parser.add_argument("--slack-ms", type=float, default=20.0, help="延迟绝对余量")
+    parser.add_argument(
+        "--session-mode", default="normal", choices=["normal", "degraded"], help="准入控制分配的会话模式"
+    )
+    args = parser.parse_args()
+
+    sessions = asyncio.run(
+        _replay_all(args.recordings, args.speed, args.db_latency_ms / 1000, args.session_mode)
+    )
+    report = {"summary": summarize(sessions), "sessions": sessions}
+    print(json.dumps(report["summary"], indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["summary"]
+        regressions = compare(report["summary"], baseline, args.tolerance, args.slack_ms / 1000)
+        if regressions:
+            print("⚠️  检测到回归:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("✓ 未检测到回归")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,41 @@
 """数据库模块"""
-from database.connection import AsyncSessionLocal, get_db
-from database.models import Agent, Room, Conversation
-from database.repositories import RoomRepository, AgentRepository, ConversationRepository
+from database.connection import (
+    AsyncSessionLocal,
+    AsyncReadSessionLocal,
+    engine,
+    writer_engine,
+    reader_engines,
+    get_db,
+    get_read_db,
+    read_session,
+)
+from database.models import Agent, Room, Conversation, ChatCheckpoint, UserProfile
+from database.repositories import (
+    RoomRepository,
+    AgentRepository,
+    ConversationRepository,
+    ChatCheckpointRepository,
+    UserProfileRepository,
+)
 
 __all__ = [
     "AsyncSessionLocal",
+    "AsyncReadSessionLocal",
+    "engine",
+    "writer_engine",
+    "reader_engines",
     "get_db",
+    "get_read_db",
+    "read_session",
     "Agent",
     "Room",
     "Conversation",
+    "ChatCheckpoint",
+    "UserProfile",
     "RoomRepository",
     "AgentRepository",
     "ConversationRepository",
+    "ChatCheckpointRepository",
+    "UserProfileRepository",
 ]
 
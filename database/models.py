@@ -62,5 +62,34 @@ class Conversation(Base):
         Index("idx_user_id", "user_id"),
         Index("idx_created_at", "created_at"),
         Index("idx_room_created", "room_name", "created_at"),
+        # 对话内容全文索引（ngram 分词，中英文均可检索），已有库需执行：
+        # ALTER TABLE ai_voice_conversations ADD FULLTEXT INDEX ft_content (content) WITH PARSER ngram;
+        Index("ft_content", "content", mysql_prefix="FULLTEXT", mysql_with_parser="ngram"),
     )
 
+
+class ChatCheckpoint(Base):
+    """对话上下文检查点表（按房间增量追加，用于 Job 重启 / 用户重连后恢复会话）"""
+    __tablename__ = "ai_voice_chat_checkpoints"
+    
+    id = Column(Integer, primary_key=True, comment="ID")
+    room_name = Column(String(100), nullable=False, comment="房间名称")
+    seq = Column(Integer, nullable=False, comment="房间内的检查点序号")
+    items = Column(Text, nullable=False, comment="本次新增的对话条目（JSON）")
+    created_at = Column(DateTime, nullable=False, server_default=func.now(), comment="创建时间")
+    
+    __table_args__ = (
+        Index("uq_room_seq", "room_name", "seq", unique=True),
+    )
+
+
+class UserProfile(Base):
+    """用户画像表（由历史对话增量生成的摘要，新会话开始时注入 Agent 指令）"""
+    __tablename__ = "ai_voice_user_profiles"
+    
+    id = Column(Integer, primary_key=True, comment="ID")
+    user_id = Column(String(100), nullable=False, unique=True, comment="用户ID")
+    summary = Column(Text, nullable=False, comment="用户画像摘要")
+    last_conversation_id = Column(Integer, nullable=False, default=0, comment="已汇总到的最后一条对话记录ID")
+    session_count = Column(Integer, nullable=False, default=0, comment="已汇总的会话数")
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now(), comment="更新时间")
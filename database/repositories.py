@@ -1,14 +1,30 @@
 """数据库仓库层"""
+import json
 from typing import Optional
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from database.models import Agent, Room, Conversation
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy import select, update, delete, case, func, literal_column
+from database.connection import read_session
+from database.models import Agent, Room, Conversation, ChatCheckpoint, UserProfile
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+async def _read_all(session: Optional[AsyncSession], query) -> list:
+    """执行可容忍复制延迟的查询
+    
+    传入会话时使用该会话；传入 None 时从只读副本读取（副本连接失败时回退主库）。
+    """
+    if session is not None:
+        result = await session.execute(query)
+        return list(result.scalars().all())
+    async with read_session() as db:
+        result = await db.execute(query)
+        return list(result.scalars().all())
+
+
 class AgentRepository:
     """Agent 数据仓库"""
     
@@ -21,10 +37,9 @@ class AgentRepository:
         return result.scalar_one_or_none()
     
     @staticmethod
-    async def get_all(session: AsyncSession) -> list[Agent]:
-        """获取所有 Agent"""
-        result = await session.execute(select(Agent))
-        return list(result.scalars().all())
+    async def get_all(session: Optional[AsyncSession] = None) -> list[Agent]:
+        """获取所有 Agent（不传会话时走只读副本）"""
+        return await _read_all(session, select(Agent))
 
 
 class RoomRepository:
@@ -77,6 +92,116 @@ class RoomRepository:
         )
         await session.flush()
         return result.rowcount > 0
+    
+    @staticmethod
+    def _close_values(closed_at: datetime) -> list[tuple]:
+        """关闭房间时的 SET 子句（有序）
+        
+        MySQL 按从左到右的顺序求值 SET 子句，chat_duration 必须先于
+        user_left_at 计算，才能基于未被覆盖的 user_left_at 判断。
+        """
+        still_in_room = Room.user_joined_at.isnot(None) & Room.user_left_at.is_(None)
+        return [
+            (
+                Room.chat_duration,
+                case(
+                    (
+                        still_in_room,
+                        func.greatest(
+                            0,
+                            func.timestampdiff(
+                                literal_column("SECOND"), Room.user_joined_at, closed_at
+                            ),
+                        ),
+                    ),
+                    else_=Room.chat_duration,
+                ),
+            ),
+            (
+                Room.user_left_at,
+                case((still_in_room, closed_at), else_=Room.user_left_at),
+            ),
+            (Room.status, "closed"),
+            (Room.closed_at, closed_at),
+        ]
+    
+    @staticmethod
+    async def close_room(
+        session: AsyncSession,
+        room_name: str,
+        closed_at: Optional[datetime] = None,
+    ) -> bool:
+        """关闭房间（单条 UPDATE）
+        
+        同时写入 status、closed_at，用户仍在房间时补记离开时间和聊天时长。
+        只更新 active 状态的房间，重复关闭不会覆盖已有记录。
+        
+        Args:
+            session: 数据库会话
+            room_name: 房间名称
+            closed_at: 关闭时间，如果为 None 则使用当前时间
+            
+        Returns:
+            bool: 是否有房间被关闭
+        """
+        if closed_at is None:
+            closed_at = datetime.now()
+        
+        result = await session.execute(
+            update(Room)
+            .where(Room.room_name == room_name, Room.status == "active")
+            .ordered_values(*RoomRepository._close_values(closed_at))
+        )
+        await session.flush()
+        return result.rowcount > 0
+    
+    @staticmethod
+    async def close_stale_rooms(
+        session: AsyncSession,
+        batch_size: int = 100,
+        grace_minutes: int = 2,
+        now: Optional[datetime] = None,
+    ) -> int:
+        """批量关闭超时的 active 房间
+        
+        超时从用户加入时间（未加入则从创建时间）起算，超过
+        timeout_minutes + grace_minutes 即视为过期。每次调用最多关闭
+        batch_size 个房间，调用方循环调用直到返回值小于 batch_size。
+        
+        Args:
+            session: 数据库会话
+            batch_size: 单批最多关闭的房间数
+            grace_minutes: 宽限时间（分钟），给 Agent 自行关闭留出余量
+            now: 当前时间，如果为 None 则使用当前时间
+            
+        Returns:
+            int: 本批关闭的房间数
+        """
+        if now is None:
+            now = datetime.now()
+        
+        started_at = func.coalesce(Room.user_joined_at, Room.created_at)
+        result = await session.execute(
+            select(Room.id)
+            .where(
+                Room.status == "active",
+                func.timestampdiff(literal_column("MINUTE"), started_at, now)
+                >= Room.timeout_minutes + grace_minutes,
+            )
+            .order_by(Room.id.asc())
+            .limit(batch_size)
+        )
+        room_ids = list(result.scalars().all())
+        if not room_ids:
+            return 0
+        
+        result = await session.execute(
+            update(Room)
+            .where(Room.id.in_(room_ids), Room.status == "active")
+            .ordered_values(*RoomRepository._close_values(now))
+        )
+        await session.flush()
+        return result.rowcount
 
 
 class ConversationRepository:
@@ -116,14 +241,16 @@ class ConversationRepository:
     
     @staticmethod
     async def get_by_room(
-        session: AsyncSession,
+        session: Optional[AsyncSession],
         room_name: str,
         limit: Optional[int] = None
     ) -> list[Conversation]:
         """根据房间名称获取对话记录
         
+        历史记录查询可容忍复制延迟，session 传 None 时走只读副本（副本不可用时回退主库）。
+        
         Args:
-            session: 数据库会话
+            session: 数据库会话，None 为只读副本
             room_name: 房间名称
             limit: 限制返回数量
             
@@ -137,6 +264,245 @@ class ConversationRepository:
         if limit:
             query = query.limit(limit)
         
-        result = await session.execute(query)
+        return await _read_all(session, query)
+
+    
+    @staticmethod
+    async def get_by_user_after(
+        session: AsyncSession,
+        user_id: str,
+        after_id: int = 0,
+        limit: int = 200,
+    ) -> list[Conversation]:
+        """获取用户 id 大于 after_id 的对话记录（按 id 升序，走 idx_user_id 范围扫描）
+        
+        Args:
+            session: 数据库会话
+            user_id: 用户ID
+            after_id: 起始记录 id（不包含）
+            limit: 限制返回数量
+            
+        Returns:
+            list[Conversation]: 对话记录列表
+        """
+        result = await session.execute(
+            select(Conversation)
+            .where(Conversation.user_id == user_id, Conversation.id > after_id)
+            .order_by(Conversation.id.asc())
+            .limit(limit)
+        )
         return list(result.scalars().all())
+    
+    @staticmethod
+    def _fulltext_phrase(text: str) -> str:
+        """把检索词转为 BOOLEAN MODE 短语（引号内的运算符按字面匹配）"""
+        return '"' + " ".join(text.replace('"', " ").split()) + '"'
+    
+    @staticmethod
+    async def search(
+        session: Optional[AsyncSession],
+        text: str,
+        agent_name: Optional[str] = None,
+        user_id: Optional[str] = None,
+        role: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        before_id: Optional[int] = None,
+        limit: int = 20,
+    ) -> list[Conversation]:
+        """全文检索对话内容（走 ft_content 全文索引，不做 LIKE 全表扫描）
+        
+        结果按 id 倒序（即写入时间倒序）返回，使用游标分页：
+        下一页传入上一页最后一条记录的 id 作为 before_id。
+        检索属于报表类查询，session 传 None 时走只读副本（副本不可用时回退主库），
+        避免与会话写入争用主库。
+        
+        Args:
+            session: 数据库会话，None 为只读副本
+            text: 检索内容（按短语匹配）
+            agent_name: 按 Agent 过滤（关联房间表）
+            user_id: 按用户过滤
+            role: 按角色过滤（user 或 agent）
+            start_time: 起始时间（包含）
+            end_time: 结束时间（不包含）
+            before_id: 分页游标，只返回 id 小于该值的记录
+            limit: 每页数量
+            
+        Returns:
+            list[Conversation]: 对话记录列表
+        """
+        phrase = ConversationRepository._fulltext_phrase(text)
+        if phrase == '""':
+            return []
+        
+        query = select(Conversation).where(Conversation.content.match(phrase))
+        
+        if agent_name:
+            query = query.join(
+                Room, Room.room_name == Conversation.room_name
+            ).where(Room.agent_name == agent_name)
+        if user_id:
+            query = query.where(Conversation.user_id == user_id)
+        if role:
+            query = query.where(Conversation.role == role)
+        if start_time:
+            query = query.where(Conversation.created_at >= start_time)
+        if end_time:
+            query = query.where(Conversation.created_at < end_time)
+        if before_id:
+            query = query.where(Conversation.id < before_id)
+        
+        query = query.order_by(Conversation.id.desc()).limit(limit)
+        
+        return await _read_all(session, query)
+
+
+class ChatCheckpointRepository:
+    """对话上下文检查点数据仓库
+    
+    检查点由刚崩溃的 Job 写入、新 Job 立即读取，读取必须走主库（AsyncSessionLocal）。
+    """
+    
+    @staticmethod
+    async def append(
+        session: AsyncSession,
+        room_name: str,
+        seq: int,
+        items: list[dict],
+    ) -> ChatCheckpoint:
+        """追加一个增量检查点
+        
+        Args:
+            session: 数据库会话
+            room_name: 房间名称
+            seq: 房间内的检查点序号（从 1 递增）
+            items: 自上一个检查点以来新增的对话条目
+        """
+        checkpoint = ChatCheckpoint(
+            room_name=room_name,
+            seq=seq,
+            items=json.dumps(items, ensure_ascii=False),
+            created_at=datetime.now(),
+        )
+        session.add(checkpoint)
+        await session.flush()
+        return checkpoint
+    
+    @staticmethod
+    async def get_items(session: AsyncSession, room_name: str) -> tuple[list[dict], int]:
+        """按序合并房间的全部增量检查点
+        
+        Returns:
+            tuple[list[dict], int]: (对话条目, 最后一个检查点序号，没有检查点时为 0)
+        """
+        result = await session.execute(
+            select(ChatCheckpoint.seq, ChatCheckpoint.items)
+            .where(ChatCheckpoint.room_name == room_name)
+            .order_by(ChatCheckpoint.seq.asc())
+        )
+        items: list[dict] = []
+        last_seq = 0
+        for seq, data in result.all():
+            items.extend(json.loads(data))
+            last_seq = seq
+        return items, last_seq
+    
+    @staticmethod
+    async def delete_for_closed_rooms(session: AsyncSession, batch_size: int = 500) -> int:
+        """删除一批已关闭房间的检查点（由房间回收任务调用）
+        
+        Returns:
+            int: 本批删除的检查点数量
+        """
+        result = await session.execute(
+            select(ChatCheckpoint.id)
+            .join(Room, Room.room_name == ChatCheckpoint.room_name)
+            .where(Room.status == "closed")
+            .limit(batch_size)
+        )
+        ids = list(result.scalars().all())
+        if not ids:
+            return 0
+        
+        result = await session.execute(
+            delete(ChatCheckpoint).where(ChatCheckpoint.id.in_(ids))
+        )
+        await session.flush()
+        return result.rowcount
 
+
+class UserProfileRepository:
+    """用户画像数据仓库"""
+    
+    @staticmethod
+    async def get_by_room(session: AsyncSession, room_name: str) -> Optional[UserProfile]:
+        """根据房间获取该房间用户的画像（一次查询：房间唯一索引 + 画像唯一索引）"""
+        result = await session.execute(
+            select(UserProfile)
+            .join(Room, Room.user_id == UserProfile.user_id)
+            .where(Room.room_name == room_name)
+        )
+        return result.scalar_one_or_none()
+    
+    @staticmethod
+    async def get_by_user(session: AsyncSession, user_id: str) -> Optional[UserProfile]:
+        """根据用户ID获取画像"""
+        result = await session.execute(
+            select(UserProfile).where(UserProfile.user_id == user_id)
+        )
+        return result.scalar_one_or_none()
+    
+    @staticmethod
+    async def advance(
+        session: AsyncSession,
+        user_id: str,
+        summary: str,
+        last_conversation_id: int,
+        expected_last_id: Optional[int],
+    ) -> bool:
+        """写入新画像并推进汇总水位，会话数加一（条件写入）
+        
+        同一用户的多个会话可能同时读到相同的水位并汇总相同的对话，
+        只有水位仍是 expected_last_id 的那一次写入生效：
+        画像已存在时 UPDATE ... WHERE last_conversation_id = expected_last_id；
+        读取时还没有画像（expected_last_id 为 None）时 INSERT IGNORE，已被其他会话创建则不写入。
+        
+        Args:
+            session: 数据库会话
+            user_id: 用户ID
+            summary: 新的画像摘要
+            last_conversation_id: 已汇总到的最后一条对话记录ID
+            expected_last_id: 读取画像时的水位（没有画像时为 None）
+            
+        Returns:
+            bool: 是否写入（False 表示水位已被其他会话推进）
+        """
+        now = datetime.now()
+        if expected_last_id is None:
+            result = await session.execute(
+                mysql_insert(UserProfile)
+                .prefix_with("IGNORE")
+                .values(
+                    user_id=user_id,
+                    summary=summary,
+                    last_conversation_id=last_conversation_id,
+                    session_count=1,
+                    updated_at=now,
+                )
+            )
+        else:
+            result = await session.execute(
+                update(UserProfile)
+                .where(
+                    UserProfile.user_id == user_id,
+                    UserProfile.last_conversation_id == expected_last_id,
+                )
+                .values(
+                    summary=summary,
+                    last_conversation_id=last_conversation_id,
+                    session_count=UserProfile.session_count + 1,
+                    updated_at=now,
+                )
+            )
+        await session.flush()
+        return result.rowcount > 0
@@ -2,6 +2,7 @@
 import os
 import logging
 import asyncio
+import tempfile
 from datetime import datetime
 from typing import Optional
 from dotenv import load_dotenv
@@ -9,13 +10,56 @@ from dotenv import load_dotenv
 # ⚠️ 必须在所有导入之前加载环境变量
 load_dotenv(".env.local")
 
+# ⚠️ 多进程指标目录必须在导入 prometheus_client（livekit）之前设置：
+# Job 子进程的指标写入该目录，由 Worker 在 PROMETHEUS_PORT 的 /metrics 统一导出
+if os.getenv("PROMETHEUS_PORT"):
+    os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR",
+        os.path.join(tempfile.gettempdir(), f"peppa-agent-prometheus-{os.getpid()}"),
+    )
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
 from livekit import agents, rtc
-from livekit.agents import AgentServer, AgentSession, Agent, room_io
-from livekit.plugins import fishaudio, silero, openai, deepgram
-from livekit.plugins.turn_detector.multilingual import MultilingualModel
+from livekit.agents import AgentServer, AgentSession, Agent, room_io, llm
+from livekit.plugins import fishaudio, openai, deepgram
 
 # 导入数据库模块
-from database import AsyncSessionLocal, RoomRepository, ConversationRepository
+from database import (
+    AsyncSessionLocal,
+    RoomRepository,
+    ConversationRepository,
+    writer_engine,
+    reader_engines,
+)
+from agent_runtime import metrics
+from agent_runtime import (
+    SessionGuard,
+    run_room_reaper,
+    LoadCalculator,
+    LoadReporter,
+    DEFAULT_LOAD_THRESHOLD,
+    BatchedVAD,
+    BatchedMultilingualModel,
+    SessionRecorder,
+    FillerPlayer,
+    ChatCheckpointer,
+    load_chat_context,
+    AdmissionController,
+    SessionProfile,
+    session_profile,
+    CachedLLM,
+    prefetch_profile,
+    apply_profile,
+    update_profile,
+)
+from agent_runtime.admission import NORMAL_PROFILE
+from agent_runtime.response_cache import LLM_RESPONSE_CACHE
+
+# 数据库连接池借出连接数（主库与只读副本分别统计）
+metrics.instrument_engine(writer_engine, "writer")
+for _i, _reader_engine in enumerate(reader_engines):
+    if _reader_engine is not writer_engine:
+        metrics.instrument_engine(_reader_engine, f"reader-{_i}")
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,8 +69,16 @@ logger = logging.getLogger(__name__)
 
 
 class Assistant(Agent):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        chat_ctx: Optional[llm.ChatContext] = None,
+        max_history_items: Optional[int] = None,
+    ) -> None:
+        # 降级模式下每次 LLM 请求只携带最近的对话条目
+        self._max_history_items = max_history_items
         super().__init__(
+            # 从检查点恢复的对话上下文（新会话为 None）
+            chat_ctx=chat_ctx,
             instructions="""
             Character
             You are Peppa Pig from the beloved British animated series. You are a cheerful, curious, and playful 4-year-old pig who loves talking with children aged 8-12. Your task is to have fun, friendly conversations with users, answer their questions, share stories about your adventures, and help them feel happy and engaged. You speak in a natural, child-friendly way that makes children feel comfortable and excited to chat with you.
@@ -90,11 +142,115 @@ class Assistant(Agent):
             Remember: You're having a real conversation with a child, not giving a formal presentation. Be spontaneous, natural, and genuinely interested in what they have to say.""",
         )
 
+    async def on_user_turn_completed(
+        self, turn_ctx: llm.ChatContext, new_message: llm.ChatMessage
+    ) -> None:
+        # turn_ctx 只用于本轮生成，截断不影响完整的会话上下文和检查点
+        if self._max_history_items:
+            turn_ctx.truncate(max_items=self._max_history_items)
+
+
+def prewarm(proc: agents.JobProcess) -> None:
+    """Job 进程启动时加载一次 VAD，进程内的所有会话共用同一个实例
+
+    只有线程执行器（多个 Job 共享进程）下才有可合并的流；进程执行器下一个进程只有一个会话，
+    逐流直接推理，不经过批处理器。
+    """
+    proc.userdata["vad"] = BatchedVAD.load(
+        batched=proc.executor_type == agents.JobExecutorType.THREAD
+    )
+
+
+def create_session(vad: BatchedVAD, profile: SessionProfile = NORMAL_PROFILE) -> AgentSession:
+    """创建 AgentSession：Deepgram STT + OpenAI LLM + Fish Audio TTS，VAD 与轮次检测批量推理
+
+    降级模式（准入控制在高负载时分配）限制单次回复的 token 数，缩短生成和合成时长。
+
+    会话回放（benchmarks.session_replay）会把这里替换为重放录制耗时的桩 provider。
+    """
+    reference_id = os.getenv("FISH_REFERENCE_ID")
+    if not reference_id:
+        raise RuntimeError(
+            "请设置环境变量 FISH_REFERENCE_ID。\n"
+            "获取方式：在 https://fish.audio/discover 选择声音，"
+            "或克隆后从 https://fish.audio/app/voice-cloning 获取 ID"
+        )
+
+    # 检查必要的 API keys
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    deepgram_api_key = os.getenv("DEEPGRAM_API_KEY")
+
+    if not openai_api_key:
+        raise RuntimeError("请设置环境变量 OPENAI_API_KEY")
+    if not deepgram_api_key:
+        raise RuntimeError("请设置环境变量 DEEPGRAM_API_KEY")
+
+    # 使用显式的 API key 配置 STT 和 LLM
+    # Deepgram 插件使用的是 Deepgram 原生模型名，这里应为 "nova-3"
+    dg_stt = deepgram.STT(
+        model="nova-3",
+        api_key=deepgram_api_key,
+    )
+
+    llm_options = {}
+    if profile.max_completion_tokens:
+        llm_options["max_completion_tokens"] = profile.max_completion_tokens
+    oa_llm = openai.LLM(
+        model="gpt-4.1-mini",
+        api_key=openai_api_key,
+        **llm_options,
+    )
+    # 常见问题回复缓存（LLM_RESPONSE_CACHE=1 启用，只作用于会话前几轮的短问题）
+    if LLM_RESPONSE_CACHE:
+        oa_llm = CachedLLM(oa_llm, persona="peppa")
+
+    tts = fishaudio.TTS(
+        reference_id=reference_id,
+        model="s1",
+        sample_rate=24000,
+        latency_mode="balanced",
+    )
+
+    session = AgentSession(
+        stt=dg_stt,
+        llm=oa_llm,
+        tts=tts,
+        # VAD 使用进程预加载的实例，轮次检测在 Worker 推理进程中跨会话批量推理
+        vad=vad,
+        turn_detection=BatchedMultilingualModel(),
+    )
+    if isinstance(oa_llm, CachedLLM):
+        # 是否第一轮按 Agent 的完整对话上下文判断（降级模式下 LLM 请求的上下文会被截断）
+        oa_llm.bind_history(lambda: session.current_agent.chat_ctx)
+    return session
+
+
+# 负载 = max(会话数, 事件循环延迟, CPU, 推理耗时)，各项按阈值归一化；
+# 设置 PROMETHEUS_PORT 后导出 lk_agents_worker_load 与各分项指标
+prometheus_port = os.getenv("PROMETHEUS_PORT")
+load_calculator = LoadCalculator()
+server = AgentServer(
+    load_fnc=load_calculator,
+    load_threshold=DEFAULT_LOAD_THRESHOLD,
+    prometheus_port=int(prometheus_port) if prometheus_port else None,
+)
+server.setup_fnc = prewarm
+
+# 准入控制：会话上限 + 有界等待队列，高负载时以降级模式接受，满载时拒绝交给其他 Worker
+admission = AdmissionController(server, load_calculator)
+
+# 房间回收任务（Worker 主进程）
+_reaper_task: Optional[asyncio.Task] = None
+
 
-server = AgentServer()
+@server.on("worker_started")
+def on_worker_started():
+    """Worker 启动后开始定期回收过期房间"""
+    global _reaper_task
+    _reaper_task = asyncio.create_task(run_room_reaper())
 
 
-@server.rtc_session()
+@server.rtc_session(on_request=admission)
 async def peppa_agent(ctx: agents.JobContext):
     """Peppa Agent - 处理所有房间，通过元数据判断是否处理"""
     
@@ -139,52 +295,61 @@ async def peppa_agent(ctx: agents.JobContext):
             f"✓ Agent 'peppa' 处理 console 房间 {ctx.room.name}（跳过 metadata 校验）"
         )
 
-    reference_id = os.getenv("FISH_REFERENCE_ID")
-    if not reference_id:
-        raise RuntimeError(
-            "请设置环境变量 FISH_REFERENCE_ID。\n"
-            "获取方式：在 https://fish.audio/discover 选择声音，"
-            "或克隆后从 https://fish.audio/app/voice-cloning 获取 ID"
+    # 准入时分配的会话模式（高负载时为降级模式）
+    session_config = session_profile(ctx)
+    if session_config is not NORMAL_PROFILE:
+        logger.warning(
+            f"⚠️  会话以 {session_config.mode} 模式运行: 上下文 {session_config.max_history_items} 条, "
+            f"回复上限 {session_config.max_completion_tokens} tokens, 关闭填充音 / 录制 / 画像更新"
         )
-
-    # 检查必要的 API keys
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    deepgram_api_key = os.getenv("DEEPGRAM_API_KEY")
     
-    if not openai_api_key:
-        raise RuntimeError("请设置环境变量 OPENAI_API_KEY")
-    if not deepgram_api_key:
-        raise RuntimeError("请设置环境变量 DEEPGRAM_API_KEY")
-
-    # 使用显式的 API key 配置 STT 和 LLM
-    # Deepgram 插件使用的是 Deepgram 原生模型名，这里应为 "nova-3"
-    dg_stt = deepgram.STT(
-        model="nova-3",
-        api_key=deepgram_api_key,
-    )
-
-    oa_llm = openai.LLM(
-        model="gpt-4.1-mini",
-        api_key=openai_api_key,
-    )
-
-    tts = fishaudio.TTS(
-        reference_id=reference_id,
-        model="s1",
-        sample_rate=24000,
-        latency_mode="balanced",
-    )
-
-    session = AgentSession(
-        stt=dg_stt,
-        llm=oa_llm,
-        tts=tts,
-        vad=silero.VAD.load(),
-        turn_detection=MultilingualModel(),
+    # 回访用户画像：与检查点读取、session.start() 并发预取
+    profile_prefetch = asyncio.create_task(prefetch_profile(room_name))
+    
+    # 同一房间的新 Job（进程崩溃 / 用户重连）从检查点恢复对话
+    restored_chat_ctx, last_checkpoint_seq = await load_chat_context(room_name)
+    
+    session = create_session(ctx.proc.userdata["vad"], session_config)
+    
+    # 会话录制（设置 SESSION_RECORDINGS_DIR 后启用，用于回放回归测试；降级模式不录制）
+    recorder = (
+        SessionRecorder.create(room_name, ctx.job.id, room_metadata)
+        if session_config.optional_features
+        else None
     )
+    if recorder:
+        recorder.attach(session, ctx.room)
+    
+    # 负载上报：会话数、事件循环延迟、VAD / 轮次检测耗时
+    load_reporter = LoadReporter.get()
+    load_reporter.start()
+    load_reporter.session_started()
+    session.on("metrics_collected", load_reporter.on_metrics_collected)
+    session.on("metrics_collected", metrics.on_metrics_collected)
+    
+    async def _on_job_shutdown():
+        load_reporter.session_ended()
+        if recorder:
+            recorder.save()
+        # 把本次会话的新对话合并进用户画像（降级模式跳过，由该用户下次会话关闭时一并汇总）
+        if session_config.optional_features:
+            await update_profile(room_name)
+    
+    ctx.add_shutdown_callback(_on_job_shutdown)
 
     room_name = ctx.room.name
     
+    # 对话上下文检查点：增量、后台合并写入
+    checkpointer = ChatCheckpointer(
+        room_name, last_checkpoint_seq, interval=session_config.checkpoint_interval
+    )
+    checkpointer.attach(session)
+    ctx.add_shutdown_callback(checkpointer.aclose)
+    
+    # 会话守护：房间超时 / 静默空闲 / 空房间时关闭会话并标记房间关闭
+    guard = SessionGuard(ctx, session, room_name)
+    guard.attach()
+    
     # ========== 辅助函数 ==========
     def get_user_id_from_participant(participant: rtc.RemoteParticipant) -> Optional[str]:
         """从参与者获取用户ID（排除Agent）"""
@@ -214,9 +379,10 @@ async def peppa_agent(ctx: agents.JobContext):
                 return
             
             logger.info(f"用户 {user_id} 进入房间 {room_name}")
+            guard.user_joined()
             
             # 更新数据库：记录用户加入时间（完全非阻塞）
-            asyncio.create_task(
+            metrics.background_task(
                 _update_user_joined_async(room_name, user_id)
             )
         except Exception as e:
@@ -225,6 +391,7 @@ async def peppa_agent(ctx: agents.JobContext):
     async def _update_user_joined_async(room_name: str, user_id: str):
         """异步更新用户加入时间（完全非阻塞）"""
         try:
+            # 读后写，且房间刚由服务端创建，必须走主库（不能容忍副本延迟）
             async with AsyncSessionLocal() as db:
                 try:
                     # 检查房间是否存在
@@ -232,8 +399,9 @@ async def peppa_agent(ctx: agents.JobContext):
                     if room:
                         # 更新用户加入时间（如果还没有记录）
                         if not room.user_joined_at:
-                            await RoomRepository.update_user_joined(db, room_name)
-                            await db.commit()
+                            async with metrics.db_write("RoomRepository.update_user_joined"):
+                                await RoomRepository.update_user_joined(db, room_name)
+                                await db.commit()
                             logger.info(f"✓ 已记录用户 {user_id} 加入房间 {room_name}")
                         else:
                             logger.debug(f"用户 {user_id} 加入时间已存在，跳过更新")
@@ -256,9 +424,10 @@ async def peppa_agent(ctx: agents.JobContext):
                 return
             
             logger.info(f"用户 {user_id} 离开房间 {room_name}")
+            guard.user_left(has_users=get_user_id_from_room() is not None)
             
             # 更新数据库：记录用户离开时间和聊天时长（完全非阻塞）
-            asyncio.create_task(
+            metrics.background_task(
                 _update_user_left_async(room_name, user_id)
             )
         except Exception as e:
@@ -278,10 +447,11 @@ async def peppa_agent(ctx: agents.JobContext):
                         
                         # 更新用户离开时间（如果还没有记录）
                         if not room.user_left_at:
-                            await RoomRepository.update_user_left(
-                                db, room_name, chat_duration, left_at=leave_time
-                            )
-                            await db.commit()
+                            async with metrics.db_write("RoomRepository.update_user_left"):
+                                await RoomRepository.update_user_left(
+                                    db, room_name, chat_duration, left_at=leave_time
+                                )
+                                await db.commit()
                             logger.info(f"✓ 已记录用户 {user_id} 离开房间 {room_name}，聊天时长: {chat_duration}秒")
                         else:
                             logger.debug(f"用户 {user_id} 离开时间已存在，跳过更新")
@@ -296,28 +466,44 @@ async def peppa_agent(ctx: agents.JobContext):
             logger.error(f"数据库连接失败（不影响Agent）: {e}", exc_info=True)
     
     # ========== 启动会话（移除噪声消除，自托管不支持）==========
+    agent = Assistant(
+        chat_ctx=restored_chat_ctx,
+        max_history_items=session_config.max_history_items,
+    )
     await session.start(
         room=ctx.room,
-        agent=Assistant(),
+        agent=agent,
         # 自托管不支持噪声消除，移除 room_options
     )
     
     logger.info(f"✓ Agent 'peppa' 会话已启动，房间: {room_name}")
     
+    # 填充音：用户说完后迟迟没有回复时播放一句角色短语（降级模式关闭）
+    # 轨道发布在后台进行，不推迟开场白（开场白本身不播放填充音）
+    if session_config.optional_features:
+        filler = FillerPlayer(session, persona="peppa")
+        metrics.background_task(filler.start(ctx.room))
+        ctx.add_shutdown_callback(filler.aclose)
+    
     # ========== 检查已存在的参与者（处理在 session.start() 之前就在房间的用户）==========
     for participant in ctx.room.remote_participants.values():
         user_id = get_user_id_from_participant(participant)
         if user_id:
             logger.info(f"检测到已存在的用户 {user_id}，记录加入时间")
+            guard.user_joined()
             # 异步记录已存在用户的加入时间
-            asyncio.create_task(
+            metrics.background_task(
                 _update_user_joined_async(room_name, user_id)
             )
     
+    guard.start()
+    
     # ========== 对话记录功能（使用多种方式确保能获取到）==========
     
     async def _save_conversation_async(room_name: str, user_id: str, role: str, content: str):
         """异步保存对话记录（完全非阻塞）"""
+        # 内层已计入失败时，rollback 再抛出的异常不能重复计数
+        lost_counted = False
         try:
             logger.debug(f"开始执行 _save_conversation_async: room={room_name}, user={user_id}, role={role}")
             
@@ -331,17 +517,22 @@ async def peppa_agent(ctx: agents.JobContext):
             async with AsyncSessionLocal() as db:
                 try:
                     logger.debug(f"调用 ConversationRepository.create: room={room_name}, user={user_id}, role={role}")
-                    await ConversationRepository.create(
-                        db, room_name, user_id, role, content
-                    )
-                    logger.debug(f"准备提交事务: room={room_name}")
-                    await db.commit()
+                    async with metrics.db_write("ConversationRepository.create"):
+                        await ConversationRepository.create(
+                            db, room_name, user_id, role, content
+                        )
+                        logger.debug(f"准备提交事务: room={room_name}")
+                        await db.commit()
                     logger.info(f"✓ 已保存对话记录: {room_name} - {role} - {content[:50]}...")
                 except Exception as e:
                     logger.error(f"保存对话记录失败（不影响Agent）: room={room_name}, error={e}", exc_info=True)
+                    metrics.transcript_write_lost("failed")
+                    lost_counted = True
                     await db.rollback()
         except Exception as e:
             logger.error(f"数据库连接失败（不影响Agent）: {e}", exc_info=True)
+            if not lost_counted:
+                metrics.transcript_write_lost("failed")
     
     def _handle_conversation_event(event, event_name: str = ""):
         """处理对话事件（通用处理函数）"""
@@ -487,13 +678,14 @@ async def peppa_agent(ctx: agents.JobContext):
             
             if not user_id:
                 logger.warning(f"未找到用户ID，跳过对话记录: event_name={event_name}, room={room_name}")
+                metrics.transcript_write_lost("dropped")
                 return
             
             logger.info(f"DEBUG: 处理对话事件: role={role}, user_id={user_id}, content={content[:50]}...")
             
             # 异步保存对话记录（完全非阻塞）
             logger.debug(f"创建异步任务保存对话记录: room={room_name}, user={user_id}, role={role}")
-            asyncio.create_task(
+            metrics.background_task(
                 _save_conversation_async(room_name, user_id, role, content)
             )
             logger.debug(f"异步任务已创建: room={room_name}")
@@ -649,7 +841,7 @@ async def peppa_agent(ctx: agents.JobContext):
                             
                             if user_id:
                                 logger.info(f"DEBUG: 从对话历史保存记录: idx={idx}, role={role}, content={content[:50]}...")
-                                asyncio.create_task(
+                                metrics.background_task(
                                     _save_conversation_async(room_name, user_id, role, content)
                                 )
                                 
@@ -672,8 +864,15 @@ async def peppa_agent(ctx: agents.JobContext):
     asyncio.create_task(save_conversation_periodically())
     logger.info(f"✓ 定期检查对话历史任务已启动，房间: {room_name}")
     
-    # 生成初始回复
-    await session.generate_reply()
+    # 生成初始回复（从检查点恢复的会话直接接着对话，不再打招呼）
+    # 用户画像在开场白开始之后于后台注入，不推迟开场白
+    if restored_chat_ctx is None:
+        greeting = session.generate_reply()
+        apply_profile(agent, profile_prefetch)
+        await greeting
+    else:
+        logger.info(f"✓ 会话已从检查点恢复，跳过开场白，房间: {room_name}")
+        apply_profile(agent, profile_prefetch)
 
 
 if __name__ == "__main__":
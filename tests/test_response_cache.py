@@ -0,0 +1,141 @@
+"""agent_runtime.response_cache：用户输入归一化与缓存条件"""
+import pytest
+
+pytest.importorskip("livekit.agents")
+
+from livekit.agents import llm  # noqa: E402
+
+from agent_runtime.response_cache import (  # noqa: E402
+    CachedLLM,
+    ResponseCache,
+    normalize_utterance,
+)
+
+INSTRUCTIONS = "You are Peppa Pig."
+
+
+@pytest.fixture
+def cached_llm(tmp_path):
+    return CachedLLM(
+        inner=None,
+        persona="peppa",
+        cache=ResponseCache(directory=str(tmp_path)),
+        max_words=8,
+    )
+
+
+def _chat_ctx(*messages: tuple[str, str], instructions: str = INSTRUCTIONS) -> llm.ChatContext:
+    chat_ctx = llm.ChatContext.empty()
+    chat_ctx.add_message(role="system", content=instructions)
+    for role, text in messages:
+        chat_ctx.add_message(role=role, content=text)
+    return chat_ctx
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("What's your FAVOURITE colour?!", "what's your favourite colour"),
+        ("What’s your favourite colour", "what's your favourite colour"),
+        ("Um, where's   George?", "where's george"),
+        ("uh... erm... hmm", ""),
+        ("Do you like muddy-puddles?", "do you like muddy puddles"),
+    ],
+)
+def test_normalize_utterance(text, expected):
+    assert normalize_utterance(text) == expected
+
+
+def test_first_turn_is_cacheable(cached_llm):
+    key = cached_llm._cache_key(
+        _chat_ctx(("assistant", "Hello! Oink!"), ("user", "Where's George?")), []
+    )
+    assert key is not None
+    assert key.startswith("peppa:")
+    assert key.endswith(":where's george")
+
+
+def test_short_reply_depends_on_greeting(cached_llm):
+    colour = cached_llm._cache_key(
+        _chat_ctx(("assistant", "What's your favourite colour?"), ("user", "Blue!")), []
+    )
+    same_question = cached_llm._cache_key(
+        _chat_ctx(("assistant", "What's your FAVOURITE colour"), ("user", "blue")), []
+    )
+    other_question = cached_llm._cache_key(
+        _chat_ctx(("assistant", "What colour is George's dinosaur?"), ("user", "Blue!")), []
+    )
+    yes_to_puddles = cached_llm._cache_key(
+        _chat_ctx(("assistant", "Do you like muddy puddles?"), ("user", "Yes")), []
+    )
+    yes_to_scared = cached_llm._cache_key(
+        _chat_ctx(("assistant", "Are you scared of spiders?"), ("user", "Yes")), []
+    )
+    assert colour is not None and colour == same_question
+    assert colour != other_question
+    assert yes_to_puddles is not None and yes_to_puddles != yes_to_scared
+
+
+def test_equivalent_utterances_share_key(cached_llm):
+    a = cached_llm._cache_key(_chat_ctx(("user", "Peppa, where's George?")), [])
+    b = cached_llm._cache_key(_chat_ctx(("user", "um where's george")), [])
+    assert a is not None and a == b
+
+
+def test_later_turns_are_not_cacheable(cached_llm):
+    chat_ctx = _chat_ctx(
+        ("user", "I'm Tom"),
+        ("assistant", "Hello Tom! Oink!"),
+        ("user", "What's my name?"),
+    )
+    assert cached_llm._cache_key(chat_ctx, []) is None
+
+
+def test_last_item_must_be_user(cached_llm):
+    chat_ctx = _chat_ctx(("user", "Where's George?"), ("assistant", "He's playing!"))
+    assert cached_llm._cache_key(chat_ctx, []) is None
+
+
+def test_tools_are_not_cacheable(cached_llm):
+    assert cached_llm._cache_key(_chat_ctx(("user", "Where's George?")), [object()]) is None
+
+
+def test_long_or_empty_utterances_are_not_cacheable(cached_llm):
+    long_text = "can you tell me a really long story about your whole family please"
+    assert cached_llm._cache_key(_chat_ctx(("user", long_text)), []) is None
+    assert cached_llm._cache_key(_chat_ctx(("user", "Um... Peppa?")), []) is None
+
+
+def test_instructions_are_part_of_key(cached_llm):
+    plain = cached_llm._cache_key(_chat_ctx(("user", "What's my name?")), [])
+    with_profile = cached_llm._cache_key(
+        _chat_ctx(("user", "What's my name?"), instructions=INSTRUCTIONS + "\nThe child is Tom."),
+        [],
+    )
+    assert plain is not None and with_profile is not None
+    assert plain != with_profile
+
+
+def test_truncated_context_uses_full_history(cached_llm):
+    # 降级模式截断后的请求上下文只剩最后一轮，看起来像第一轮
+    history = _chat_ctx(
+        ("assistant", "Hello! Oink!"),
+        ("user", "I'm Tom"),
+        ("assistant", "Hello Tom! Oink!"),
+    )
+    truncated = _chat_ctx(("assistant", "Hello Tom! Oink!"), ("user", "What's my name?"))
+    assert cached_llm._cache_key(truncated, []) is not None
+    assert cached_llm._cache_key(truncated, [], history=history) is None
+
+
+def test_full_history_first_turn(cached_llm):
+    history = _chat_ctx(("assistant", "Hello! What's your favourite colour?"))
+    chat_ctx = _chat_ctx(("assistant", "Hello! What's your favourite colour?"), ("user", "Blue"))
+    key = cached_llm._cache_key(chat_ctx, [], history=history)
+    assert key is not None
+    assert key == cached_llm._cache_key(chat_ctx, [])
+
+    # 完整上下文已包含本轮用户输入时同样视为第一轮
+    history.items.append(chat_ctx.items[-1])
+    assert cached_llm._cache_key(chat_ctx, [], history=history) == key
+